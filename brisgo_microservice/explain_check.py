@@ -0,0 +1,127 @@
+import argparse
+import importlib.util
+import os
+import sys
+
+from sqlalchemy import event, or_
+
+# Checks that the hot queries of an app.py use indexes. The read endpoints
+# run through the Flask test client for one user; the lookups of the write
+# endpoints (match dedup, invite by room, user by friend code) run directly.
+# Every SELECT they send is then run again under EXPLAIN, and any step that
+# reads a whole table (type ALL) fails the check.
+#   python explain_check.py local/app.py [--firebase-code CODE]
+# Run it against a database with production-like data (e.g. a restored
+# backup), after migrate.py: on near-empty tables MySQL prefers full scans
+# whatever the indexes. Without --firebase-code the user with the most
+# matches is used. Nothing is written.
+
+
+def load_app(path):
+    path = os.path.abspath(path)
+    sys.path.insert(0, os.path.dirname(path))
+    spec = importlib.util.spec_from_file_location("brisgo_app", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def busiest_firebase_code(ms):
+    row = (
+        ms.db.session.query(ms.User.firebase_code)
+        .join(ms.Match, ms.Match.host_id == ms.User.id)
+        .filter(ms.User.id != 1, ms.User.firebase_code.isnot(None))
+        .group_by(ms.User.id, ms.User.firebase_code)
+        .order_by(ms.db.func.count().desc())
+        .first()
+    )
+    if row is None:
+        sys.exit("No user with matches, pass --firebase-code")
+    return row.firebase_code
+
+
+# (name, callable) of every hot query path, for the user with this code
+def hot_paths(ms, client, firebase_code):
+    user = ms.User.query.filter_by(firebase_code=firebase_code).first()
+    if user is None:
+        sys.exit(f"No user with firebase_code {firebase_code}")
+    match = ms.Match.query.filter(or_(ms.Match.host_id == user.id, ms.Match.joiner_id == user.id)).first()
+    invite = ms.MatchInvite.query.filter_by(invitee_id=user.id).first()
+    # Plain values: the rollback after each path expires the objects, and
+    # reloading them would add queries to the next path
+    user_id, cups, friend_code = user.id, user.cups, user.friend_code
+    match_key = None if match is None else (match.host_id, match.joiner_id, match.createdAt)
+    room_id = None if invite is None else invite.room_id
+
+    def post(url, **payload):
+        return lambda: client.post(url, json=payload)
+
+    def get(url):
+        return lambda: client.get(url)
+
+    paths = [
+        ("POST /users", post("/users", firebase_code=firebase_code)),
+        ("POST /users/stats", post("/users/stats", firebase_code=firebase_code)),
+        ("GET /leaderboard/global?limit", get("/leaderboard/global?limit=50")),
+        ("GET /leaderboard/global?cursor", get(f"/leaderboard/global?limit=50&cursor={cups}:{user_id}")),
+        ("POST /leaderboard/friends", post("/leaderboard/friends", firebase_code=firebase_code)),
+        ("POST /match-invites/list", post("/match-invites/list", firebase_code=firebase_code)),
+        ("user by friend code", lambda: ms.User.query.filter_by(friend_code=friend_code).first()),
+    ]
+    for status in ("pending", "accepted", "rejected", "waiting"):
+        paths.append((f"POST /friendships {status}", post("/friendships", firebase_code=firebase_code, status=status)))
+    for mode in ("online", "cpu"):
+        paths.append((f"compute_user_stats {mode}", lambda mode=mode: ms.compute_user_stats(user_id, mode)))
+    if match_key is not None:
+        host_id, joiner_id, created_at = match_key
+        paths.append(("match dedup lookup", lambda: ms.Match.query.filter_by(
+            host_id=host_id, joiner_id=joiner_id, createdAt=created_at,
+        ).first()))
+    if room_id is not None:
+        paths.append(("invite by room", lambda: ms.MatchInvite.query.filter_by(room_id=room_id).first()))
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("app", help="path of the app.py to check (local/app.py or remote/app.py)")
+    parser.add_argument("--firebase-code", default=None, help="user whose requests are checked")
+    args = parser.parse_args()
+
+    ms = load_app(args.app)
+    failures = 0
+    with ms.app.app_context():
+        firebase_code = args.firebase_code or busiest_firebase_code(ms)
+        client = ms.app.test_client()
+        for name, run in hot_paths(ms, client, firebase_code):
+            statements = []
+
+            def capture(conn, cursor, statement, parameters, context, executemany):
+                if statement.lstrip().upper().startswith(("SELECT", "WITH")):
+                    statements.append((statement, parameters))
+
+            event.listen(ms.db.engine, "before_cursor_execute", capture)
+            try:
+                run()
+            finally:
+                event.remove(ms.db.engine, "before_cursor_execute", capture)
+                ms.db.session.rollback()
+
+            print(name)
+            with ms.db.engine.connect() as conn:
+                for statement, parameters in statements:
+                    for row in conn.exec_driver_sql("EXPLAIN " + statement, parameters).mappings():
+                        # <derivedN>/<unionN> are the subquery results, not tables
+                        scan = row["type"] == "ALL" and not str(row["table"]).startswith("<")
+                        failures += scan
+                        print(
+                            f"  {'FULL SCAN' if scan else 'ok':9}  {row['table']}: {row['type']}"
+                            f" key={row['key']} rows={row['rows']} {row['Extra'] or ''}"
+                        )
+    if failures:
+        sys.exit(f"{failures} full table scans")
+    print("All hot queries use indexes")
+
+
+if __name__ == "__main__":
+    main()
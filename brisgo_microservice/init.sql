@@ -2,6 +2,13 @@ DROP DATABASE IF EXISTS brisgo;
 CREATE DATABASE brisgo;
 USE brisgo;
 
+CREATE TABLE PHOTOS (
+  hash         CHAR(64) PRIMARY KEY,
+  content_type VARCHAR(32) NOT NULL,
+  data         LONGBLOB NOT NULL,
+  thumbnail    LONGBLOB DEFAULT NULL
+);
+
 CREATE TABLE USERS (
   id               INTEGER PRIMARY KEY AUTO_INCREMENT,
   nickname         VARCHAR(64) DEFAULT NULL,
@@ -9,7 +16,10 @@ CREATE TABLE USERS (
   friend_code      VARCHAR(16) NOT NULL UNIQUE, 
   photo            LONGBLOB DEFAULT NULL, 
   cups             INTEGER NOT NULL DEFAULT 0, 
-  google_photo_url VARCHAR(100) DEFAULT NULL
+  google_photo_url VARCHAR(100) DEFAULT NULL,
+  photo_hash       CHAR(64) DEFAULT NULL,
+  INDEX idx_users_leaderboard (cups DESC, id ASC),
+  FOREIGN KEY (photo_hash) REFERENCES PHOTOS(hash)
 );
 
 CREATE TABLE FRIENDSHIPS (
@@ -19,6 +29,7 @@ CREATE TABLE FRIENDSHIPS (
   status      ENUM ('pending', 'waiting', 'accepted', 'rejected') DEFAULT 'pending',
   CHECK       (user_id <> friend_id),
   UNIQUE      (user_id, friend_id),
+  INDEX idx_friendships_status (user_id, status, friend_id),
   FOREIGN KEY (user_id) REFERENCES USERS(id ),
   FOREIGN KEY (friend_id) REFERENCES USERS(id)
 );
@@ -33,7 +44,20 @@ CREATE TABLE MATCHES (
   joiner_points SMALLINT NOT NULL DEFAULT 0,
   FOREIGN KEY (host_id) REFERENCES USERS(id),
   FOREIGN KEY (joiner_id) REFERENCES USERS(id),
-  UNIQUE (createdAt, host_id, joiner_id)
+  UNIQUE (createdAt, host_id, joiner_id),
+  INDEX idx_matches_host (host_id, mode, createdAt, joiner_id, host_points, joiner_points),
+  INDEX idx_matches_joiner (joiner_id, mode, createdAt, host_id, host_points, joiner_points)
+);
+
+CREATE TABLE USER_STATS (
+  user_id       INTEGER NOT NULL,
+  mode          ENUM ('online', 'cpu') NOT NULL,
+  games         INTEGER NOT NULL DEFAULT 0,
+  wins          INTEGER NOT NULL DEFAULT 0,
+  win_streak    INTEGER NOT NULL DEFAULT 0,
+  last_match_at BIGINT NOT NULL DEFAULT 0,
+  PRIMARY KEY (user_id, mode),
+  FOREIGN KEY (user_id) REFERENCES USERS(id)
 );
 
 CREATE TABLE MATCH_INVITE (
@@ -45,6 +69,21 @@ CREATE TABLE MATCH_INVITE (
   CHECK       (inviter_id <> invitee_id),
   FOREIGN KEY (inviter_id) REFERENCES USERS(id),
   FOREIGN KEY (invitee_id) REFERENCES USERS(id),
-  UNIQUE (inviter_id, invitee_id, room_id)
+  UNIQUE (inviter_id, invitee_id, room_id),
+  INDEX idx_invite_invitee (invitee_id, status, inviter_id, room_id),
+  INDEX idx_invite_room (room_id)
+);
+
+-- Migrations already contained in this schema, skipped by migrate.py. Add
+-- every new migration here as well as in migrations/
+CREATE TABLE SCHEMA_MIGRATIONS (
+  version    VARCHAR(100) PRIMARY KEY,
+  applied_at BIGINT NOT NULL DEFAULT (UNIX_TIMESTAMP())
 );
 
+INSERT INTO SCHEMA_MIGRATIONS (version) VALUES
+  ('001_users_rank_index'),
+  ('002_user_stats'),
+  ('003_users_leaderboard_index'),
+  ('004_photos'),
+  ('005_access_path_indexes');
@@ -0,0 +1,117 @@
+import argparse
+import os
+import sys
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+
+# Applies the migrations/NNN_name.sql files missing from SCHEMA_MIGRATIONS,
+# in order, and records each one once it has run. MySQL commits DDL
+# immediately, so a failed migration stops the run with the previous ones
+# recorded: fix it and run again.
+#   python migrate.py            apply the pending migrations
+#   python migrate.py --status   list applied and pending migrations
+#   python migrate.py --baseline 004_photos
+#                                record the migrations up to 004 as applied
+#                                without running them (databases migrated
+#                                by hand before this script existed)
+# Databases created from init.sql already list every migration it contains.
+# The database comes from --url, DATABASE_URL, or the DB_* variables of the
+# apps (INSTANCE_CONNECTION_NAME for the Cloud SQL socket).
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS SCHEMA_MIGRATIONS (
+  version    VARCHAR(100) PRIMARY KEY,
+  applied_at BIGINT NOT NULL DEFAULT (UNIX_TIMESTAMP())
+)
+"""
+
+
+def database_url():
+    if os.getenv("DATABASE_URL"):
+        return os.environ["DATABASE_URL"]
+    user = os.environ["DB_USER"]
+    password = os.environ["DB_PASSWORD"]
+    name = os.environ["DB_NAME"]
+    if os.getenv("INSTANCE_CONNECTION_NAME"):
+        return (
+            f"mysql+pymysql://{user}:{password}@/"
+            f"{name}?unix_socket=/cloudsql/{os.environ['INSTANCE_CONNECTION_NAME']}"
+        )
+    host = os.getenv("DB_HOST", "localhost")
+    port = os.getenv("DB_PORT", "3306")
+    return f"mysql+pymysql://{user}:{password}@{host}:{port}/{name}"
+
+
+# [(version, path)] sorted by their number prefix
+def list_migrations():
+    migrations = []
+    for name in sorted(os.listdir(MIGRATIONS_DIR)):
+        if name.endswith(".sql") and name[:3].isdigit():
+            migrations.append((name[:-4], os.path.join(MIGRATIONS_DIR, name)))
+    return migrations
+
+
+# Statements of a migration file: "--" comment lines dropped, split on ";"
+def read_statements(path):
+    with open(path) as f:
+        lines = [line for line in f if not line.lstrip().startswith("--")]
+    return [s.strip() for s in "".join(lines).split(";") if s.strip()]
+
+
+def applied_versions(conn):
+    conn.exec_driver_sql(CREATE_TABLE)
+    return {row[0] for row in conn.execute(text("SELECT version FROM SCHEMA_MIGRATIONS"))}
+
+
+def record(conn, version):
+    conn.execute(text("INSERT INTO SCHEMA_MIGRATIONS (version) VALUES (:version)"), {"version": version})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=None, help="SQLAlchemy database URL")
+    parser.add_argument("--status", action="store_true", help="only list the migrations")
+    parser.add_argument("--baseline", default=None, metavar="VERSION",
+                        help="record the migrations up to VERSION as applied, without running them")
+    args = parser.parse_args()
+
+    load_dotenv()
+    engine = create_engine(args.url or database_url())
+    migrations = list_migrations()
+    versions = [version for version, _ in migrations]
+    if args.baseline is not None and args.baseline not in versions:
+        sys.exit(f"Unknown migration {args.baseline}, expected one of: {', '.join(versions)}")
+
+    with engine.connect() as conn:
+        applied = applied_versions(conn)
+        conn.commit()
+        pending = [(version, path) for version, path in migrations if version not in applied]
+
+        if args.status:
+            for version in versions:
+                print(f"{'applied' if version in applied else 'pending'}  {version}")
+            return
+
+        if args.baseline is not None:
+            last = versions.index(args.baseline)
+            for version, _ in pending:
+                if versions.index(version) <= last:
+                    record(conn, version)
+                    print(f"recorded {version}")
+            conn.commit()
+            return
+
+        if not pending:
+            print("Database is up to date")
+        for version, path in pending:
+            print(f"applying {version}")
+            for statement in read_statements(path):
+                conn.exec_driver_sql(statement)
+            record(conn, version)
+            conn.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,2 @@
+-- Global rank and leaderboard order: cups desc, id asc
+CREATE INDEX idx_users_cups_id ON USERS (cups, id);
@@ -0,0 +1,29 @@
+-- Per user and mode match totals, maintained by create_match
+CREATE TABLE USER_STATS (
+  user_id       INTEGER NOT NULL,
+  mode          ENUM ('online', 'cpu') NOT NULL,
+  games         INTEGER NOT NULL DEFAULT 0,
+  wins          INTEGER NOT NULL DEFAULT 0,
+  win_streak    INTEGER NOT NULL DEFAULT 0,
+  last_match_at BIGINT NOT NULL DEFAULT 0,
+  PRIMARY KEY (user_id, mode),
+  FOREIGN KEY (user_id) REFERENCES USERS(id)
+);
+
+-- Backfill from the match history: one row per player and match (the CPU
+-- user, id 1, has no stats), the streak counts the wins newer than the
+-- latest non-win
+INSERT INTO USER_STATS (user_id, mode, games, wins, win_streak, last_match_at)
+WITH played AS (
+  SELECT id, mode, createdAt, host_id AS user_id, host_points > joiner_points AS won FROM MATCHES
+  UNION ALL
+  SELECT id, mode, createdAt, joiner_id AS user_id, joiner_points > host_points AS won FROM MATCHES
+), history AS (
+  SELECT user_id, mode, createdAt, won,
+         SUM(1 - won) OVER (PARTITION BY user_id, mode ORDER BY createdAt DESC, id DESC) AS non_wins
+  FROM played
+  WHERE user_id <> 1
+)
+SELECT user_id, mode, COUNT(*), SUM(won), SUM(non_wins = 0), MAX(createdAt)
+FROM history
+GROUP BY user_id, mode;
@@ -0,0 +1,5 @@
+-- Leaderboard pages read cups desc, id asc: a descending index serves that
+-- order without a filesort, and the global rank COUNT as well
+ALTER TABLE USERS
+  DROP INDEX idx_users_cups_id,
+  ADD INDEX idx_users_leaderboard (cups DESC, id ASC);
@@ -0,0 +1,29 @@
+-- Profile photos move out of USERS into PHOTOS, keyed by SHA-256 of the
+-- bytes. USERS.photo is kept for rollback: the app no longer reads it and
+-- clears it on the next upload
+CREATE TABLE PHOTOS (
+  hash         CHAR(64) PRIMARY KEY,
+  content_type VARCHAR(32) NOT NULL,
+  data         LONGBLOB NOT NULL,
+  thumbnail    LONGBLOB DEFAULT NULL
+);
+
+ALTER TABLE USERS
+  ADD COLUMN photo_hash CHAR(64) DEFAULT NULL,
+  ADD FOREIGN KEY (photo_hash) REFERENCES PHOTOS(hash);
+
+-- Thumbnails are generated by the app on the first ?size=thumb request
+INSERT IGNORE INTO PHOTOS (hash, content_type, data)
+SELECT SHA2(photo, 256),
+       CASE
+         WHEN LEFT(photo, 3) = X'FFD8FF' THEN 'image/jpeg'
+         WHEN LEFT(photo, 8) = X'89504E470D0A1A0A' THEN 'image/png'
+         WHEN LEFT(photo, 4) = X'47494638' THEN 'image/gif'
+         WHEN LEFT(photo, 4) = X'52494646' AND SUBSTRING(photo, 9, 4) = X'57454250' THEN 'image/webp'
+         ELSE 'application/octet-stream'
+       END,
+       photo
+FROM USERS
+WHERE photo IS NOT NULL;
+
+UPDATE USERS SET photo_hash = SHA2(photo, 256) WHERE photo IS NOT NULL;
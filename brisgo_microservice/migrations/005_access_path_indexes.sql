@@ -0,0 +1,19 @@
+-- Indexes for the hot queries of app.py, covering where the rows are small.
+-- InnoDB secondary indexes also hold the primary key (id)
+
+-- USER_STATS recomputation (compute_user_stats): the matches of a user in a
+-- mode, newest first, as host OR joiner. MySQL merges the two index ranges
+-- and never reads the table rows
+ALTER TABLE MATCHES
+  ADD INDEX idx_matches_host (host_id, mode, createdAt, joiner_id, host_points, joiner_points),
+  ADD INDEX idx_matches_joiner (joiner_id, mode, createdAt, host_id, host_points, joiner_points);
+
+-- /match-invites/list reads the pending invites of an invitee with their
+-- inviter; PUT /match-invites looks invites up by room
+ALTER TABLE MATCH_INVITE
+  ADD INDEX idx_invite_invitee (invitee_id, status, inviter_id, room_id),
+  ADD INDEX idx_invite_room (room_id);
+
+-- /friendships and /leaderboard/friends: the friends of a user by status
+ALTER TABLE FRIENDSHIPS
+  ADD INDEX idx_friendships_status (user_id, status, friend_id);
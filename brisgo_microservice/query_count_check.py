@@ -0,0 +1,107 @@
+import argparse
+import hashlib
+import os
+import sys
+import uuid
+
+from flask import g
+
+from explain_check import load_app
+
+# Checks that the list endpoints of an app.py send the same number of SQL
+# statements whatever the number of rows they list (no query per friend or
+# invite). For a user with 1 and then with --rows accepted friends, each of
+# them also inviting the user to a match, the X-DB-Queries header of
+# /friendships, /leaderboard/friends and /match-invites/list must be equal.
+#   python query_count_check.py local/app.py [--rows 20]
+# The users, friendships and invites are created in the check's transaction
+# and rolled back at the end: run it against a development database, after
+# migrate.py. Nothing is committed.
+
+
+def new_user(ms, name):
+    user = ms.User(
+        nickname=name,
+        firebase_code=f"qcheck-{uuid.uuid4().hex[:16]}",
+        friend_code=ms.generate_friend_code(),
+    )
+    ms.db.session.add(user)
+    ms.db.session.flush()
+    return user
+
+
+# A user with `rows` accepted friends, each with a photo (read for the
+# deprecated base64 fields, see app.LEGACY_PHOTO_FIELDS) and a pending invite
+# for them
+def user_with_rows(ms, rows):
+    user = new_user(ms, "qcheck")
+    for i in range(rows):
+        friend = new_user(ms, f"qcheck-friend-{i}")
+        data = f"qcheck-{uuid.uuid4().hex}".encode()
+        photo = ms.Photo(hash=hashlib.sha256(data).hexdigest(), content_type="image/png", data=data)
+        ms.db.session.add(photo)
+        friend.photo_hash = photo.hash
+        ms.db.session.add_all([
+            ms.Friendship(user_id=user.id, friend_id=friend.id, status="accepted"),
+            ms.Friendship(user_id=friend.id, friend_id=user.id, status="accepted"),
+            ms.MatchInvite(room_id=f"qcheck-{uuid.uuid4().hex}", inviter_id=friend.id, invitee_id=user.id),
+        ])
+    ms.db.session.flush()
+    return user.firebase_code
+
+
+# {endpoint: (queries, listed rows)} of the list endpoints for this user
+def query_counts(client, firebase_code):
+    requests = {
+        "POST /friendships": ("/friendships", {"firebase_code": firebase_code, "status": "accepted"}, "friends"),
+        "POST /leaderboard/friends": ("/leaderboard/friends", {"firebase_code": firebase_code}, "leaderboard"),
+        "POST /match-invites/list": ("/match-invites/list", {"firebase_code": firebase_code}, "invites"),
+    }
+    counts = {}
+    for name, (url, payload, key) in requests.items():
+        # Warm up first: the user lookup cache would save a query on the
+        # second user only
+        client.post(url, json=payload)
+        # g lives in the app context shared by the requests: restart the count
+        g.pop("db_queries", None)
+        response = client.post(url, json=payload)
+        if response.status_code != 200 or "X-DB-Queries" not in response.headers:
+            sys.exit(f"{name}: status {response.status_code}, headers {dict(response.headers)}")
+        counts[name] = (int(response.headers["X-DB-Queries"]), len(response.get_json()[key]))
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("app", help="path of the app.py to check (local/app.py or remote/app.py)")
+    parser.add_argument("--rows", type=int, default=20, help="friends and invites of the second user")
+    args = parser.parse_args()
+
+    os.environ["QUERY_COUNT_HEADER"] = "1"
+    ms = load_app(args.app)
+    failures = 0
+    with ms.app.app_context():
+        # Requests of the test client share this context's session, so they
+        # see the uncommitted rows
+        client = ms.app.test_client()
+        try:
+            one = query_counts(client, user_with_rows(ms, 1))
+            many = query_counts(client, user_with_rows(ms, args.rows))
+        finally:
+            ms.db.session.rollback()
+
+    for name in one:
+        (queries_one, rows_one), (queries_many, rows_many) = one[name], many[name]
+        ok = queries_one == queries_many
+        failures += not ok
+        print(
+            f"  {'ok' if ok else 'N+1':4}  {name}: {queries_one} queries for {rows_one} rows,"
+            f" {queries_many} for {rows_many}"
+        )
+    if failures:
+        sys.exit(f"{failures} endpoints with a query count growing with their rows")
+    print("Query counts do not depend on the number of rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,24 @@
 import base64
+import hashlib
+import io
 import os
 import secrets
 import string
-from flask import Flask, jsonify, request, abort
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from flask import Flask, Response, g, has_request_context, jsonify, request, abort
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Enum, CheckConstraint, UniqueConstraint, or_
+from sqlalchemy import Enum, CheckConstraint, UniqueConstraint, and_, case, event, or_, select
+from sqlalchemy.engine import Engine
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.dialects.mysql import LONGBLOB
+from sqlalchemy.dialects.mysql import LONGBLOB, insert as mysql_insert
+
+# Only needed to generate photo thumbnails
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
 
 # App & DB configuration
 app = Flask(__name__)
@@ -33,16 +45,16 @@ class User(db.Model):
     firebase_code = db.Column(db.String(50), unique=True)
     friend_code = db.Column(db.String(16), nullable=False, unique=True)
     google_photo_url = db.Column(db.String(100))
-    photo = db.Column(LONGBLOB)
+    # Legacy inline photo, copied to PHOTOS by migration 004: deferred so
+    # user queries never load it
+    photo = db.deferred(db.Column(LONGBLOB))
+    photo_hash = db.Column(db.String(64), db.ForeignKey("PHOTOS.hash"))
     cups = db.Column(db.Integer, nullable=False, server_default="0")
 
     def to_dict(self):
-        photo_base64 = None
-        if self.photo is not None:
-            photo_base64 = base64.b64encode(self.photo).decode("ascii")
         return {
             "id": self.id,
-            "photo": photo_base64,
+            "photo_url": photo_url(self.photo_hash),
             "nickname": self.nickname,
             "firebase_code": self.firebase_code,
             "friend_code": self.friend_code,
@@ -51,6 +63,23 @@ class User(db.Model):
         }
 
 
+# Profile photos keyed by the SHA-256 of their bytes, served by
+# GET /photos/<hash>: a hash never changes content, so clients and proxies
+# cache it for good and identical uploads are stored once
+class Photo(db.Model):
+    __tablename__ = "PHOTOS"
+
+    hash = db.Column(db.String(64), primary_key=True)
+    content_type = db.Column(db.String(32), nullable=False)
+    data = db.deferred(db.Column(LONGBLOB, nullable=False))
+    thumbnail = db.deferred(db.Column(LONGBLOB))
+
+
+# Leaderboard order (cups desc, id asc) as a descending index: global rank
+# counts and leaderboard pages are index range scans, without a filesort
+db.Index("idx_users_leaderboard", User.cups.desc(), User.id)
+
+
 class Friendship(db.Model):
     __tablename__ = "FRIENDSHIPS"
     __table_args__ = (
@@ -76,6 +105,10 @@ class Friendship(db.Model):
         }
 
 
+# Friends of a user by status, without reading the rows
+db.Index("idx_friendships_status", Friendship.user_id, Friendship.status, Friendship.friend_id)
+
+
 class Match(db.Model):
     __tablename__ = "MATCHES"
 
@@ -99,6 +132,39 @@ class Match(db.Model):
         }
 
 
+# Matches of a user in a mode by date, as host or joiner, covering the
+# columns compute_user_stats reads
+db.Index(
+    "idx_matches_host",
+    Match.host_id, Match.mode, Match.createdAt, Match.joiner_id, Match.host_points, Match.joiner_points,
+)
+db.Index(
+    "idx_matches_joiner",
+    Match.joiner_id, Match.mode, Match.createdAt, Match.host_id, Match.host_points, Match.joiner_points,
+)
+
+
+# Per user and mode totals, kept up to date by create_match so /users/stats
+# reads one row instead of the whole match history
+class UserStats(db.Model):
+    __tablename__ = "USER_STATS"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("USERS.id"), primary_key=True)
+    mode = db.Column(Enum("online", "cpu", name="match_mode"), primary_key=True)
+    games = db.Column(db.Integer, nullable=False, server_default="0")
+    wins = db.Column(db.Integer, nullable=False, server_default="0")
+    win_streak = db.Column(db.Integer, nullable=False, server_default="0")
+    last_match_at = db.Column(db.BigInteger, nullable=False, server_default="0")
+
+    def to_dict(self):
+        return {
+            "total_win": self.wins,
+            "win_streak": self.win_streak,
+            "win_rate": (self.wins / self.games) if self.games else 0,
+            "total_game_played": self.games,
+        }
+
+
 class MatchInvite(db.Model):
     __tablename__ = "MATCH_INVITE"
     __table_args__ = (
@@ -124,6 +190,11 @@ class MatchInvite(db.Model):
             "status": self.status,
         }
 
+
+# Pending invites of an invitee with their inviter, and invites by room
+db.Index("idx_invite_invitee", MatchInvite.invitee_id, MatchInvite.status, MatchInvite.inviter_id, MatchInvite.room_id)
+db.Index("idx_invite_room", MatchInvite.room_id)
+
 # Utils
 def parse_json(required_fields=None):
     if not request.is_json:
@@ -156,12 +227,286 @@ def generate_friend_code():
             return code
 
 
+# Users resolved by firebase_code or friend_code, kept in memory: the
+# endpoints using them only need the id, so their first query becomes a dict
+# lookup. Entries only hold fields no endpoint changes, so they never go
+# stale and two requests caching the same user concurrently store the same
+# value. Endpoints reading other fields (cups, nickname, photo) load the
+# row. Least recently used entries go first, the TTL bounds how long
+# entries of deleted users stay
+CachedUser = namedtuple("CachedUser", "id firebase_code friend_code")
+USER_CACHE_TTL = 60.0
+USER_CACHE_SIZE = 10_000
+user_cache = OrderedDict()
+user_cache_lock = threading.Lock()
+
+
+def cached_user(field, value):
+    key = (field, value)
+    now = time.monotonic()
+    with user_cache_lock:
+        entry = user_cache.get(key)
+        if entry is not None and entry[0] > now:
+            user_cache.move_to_end(key)
+            return entry[1]
+    row = (
+        db.session.query(*(getattr(User, name) for name in CachedUser._fields))
+        .filter(getattr(User, field) == value)
+        .first()
+    )
+    if row is None:
+        return None
+    user = CachedUser(*row)
+    with user_cache_lock:
+        for cache_key in (("firebase_code", user.firebase_code), ("friend_code", user.friend_code)):
+            if cache_key[1] is not None:
+                user_cache[cache_key] = (now + USER_CACHE_TTL, user)
+                user_cache.move_to_end(cache_key)
+        while len(user_cache) > USER_CACHE_SIZE:
+            user_cache.popitem(last=False)
+    return user
+
+
 def get_user_by_firebase(firebase_code):
-    return User.query.filter_by(firebase_code=firebase_code).first()
+    return cached_user("firebase_code", firebase_code)
+
+
+def get_user_by_friend_code(friend_code):
+    return cached_user("friend_code", friend_code)
+
+
+# 1 + users ahead in the global leaderboard (cups desc, id asc, CPU user
+# excluded): one COUNT over a range of idx_users_leaderboard
+def get_global_rank(user):
+    ahead = db.session.query(db.func.count(User.id)).filter(
+        User.id != 1,
+        or_(User.cups > user.cups, and_(User.cups == user.cups, User.id < user.id)),
+    ).scalar()
+    return ahead + 1
+
+
+# games, wins and current win streak of a user in a mode, aggregated in SQL:
+# the streak counts the wins newer than the latest non-win (window sum of
+# non-wins over the matches, newest first)
+def compute_user_stats(user_id, mode):
+    won = case(
+        (and_(Match.host_id == user_id, Match.host_points > Match.joiner_points), 1),
+        (and_(Match.joiner_id == user_id, Match.joiner_points > Match.host_points), 1),
+        else_=0,
+    )
+    history = select(
+        won.label("won"),
+        db.func.sum(1 - won).over(order_by=(Match.createdAt.desc(), Match.id.desc())).label("non_wins"),
+    ).where(
+        Match.mode == mode,
+        or_(Match.host_id == user_id, Match.joiner_id == user_id),
+    ).subquery()
+    games, wins, win_streak = db.session.execute(
+        select(
+            db.func.count(),
+            db.func.coalesce(db.func.sum(history.c.won), 0),
+            db.func.coalesce(db.func.sum(case((history.c.non_wins == 0, 1), else_=0)), 0),
+        )
+    ).one()
+    return int(games), int(wins), int(win_streak)
+
+
+# Add a new match to the USER_STATS rows of both players, in the caller's
+# transaction. Matches normally arrive in createdAt order and only bump the
+# counters; an older match arriving late gets its rows recomputed. The CPU
+# user (id 1) has no stats
+def record_match_stats(match):
+    outcomes = {
+        match.host_id: match.host_points > match.joiner_points,
+        match.joiner_id: match.joiner_points > match.host_points,
+    }
+    # Rows locked in user id order, so two matches of the same players never
+    # wait on each other's second row
+    for user_id, won in sorted(outcomes.items()):
+        if user_id == 1:
+            continue
+        # Create the row if missing without failing when a concurrent first
+        # match of the user creates it too: the second insert waits for the
+        # first transaction, then leaves its row untouched
+        db.session.execute(
+            mysql_insert(UserStats)
+            .values(user_id=user_id, mode=match.mode)
+            .on_duplicate_key_update(games=UserStats.games)
+        )
+        stats = UserStats.query.filter_by(user_id=user_id, mode=match.mode).with_for_update().one()
+        if match.createdAt >= stats.last_match_at:
+            stats.games += 1
+            stats.wins += int(won)
+            stats.win_streak = stats.win_streak + 1 if won else 0
+            stats.last_match_at = match.createdAt
+        else:
+            stats.games, stats.wins, stats.win_streak = compute_user_stats(user_id, match.mode)
+
+
+# User fields of User.to_dict, selected as plain columns so list endpoints
+# read users (joined to their friendships, invites...) in one query without
+# building User objects
+PROFILE_COLUMNS = (
+    User.id,
+    User.nickname,
+    User.firebase_code,
+    User.friend_code,
+    User.google_photo_url,
+    User.cups,
+    User.photo_hash,
+)
+LEADERBOARD_MAX_LIMIT = 100
+
+
+def profile_dict(row):
+    data = {column.key: getattr(row, column.key) for column in PROFILE_COLUMNS}
+    data["photo_url"] = photo_url(data.pop("photo_hash"))
+    return data
+
+
+# One leaderboard page, keyset paginated: the rows after (cups, id) in
+# cups desc, id asc order
+def leaderboard_page(limit, after=None):
+    query = db.session.query(*PROFILE_COLUMNS).filter(User.id != 1)
+    if after is not None:
+        cups, user_id = after
+        query = query.filter(or_(User.cups < cups, and_(User.cups == cups, User.id > user_id)))
+    rows = query.order_by(User.cups.desc(), User.id.asc()).limit(limit).all()
+    return [dict(profile_dict(row), has_photo=row.photo_hash is not None) for row in rows]
+
+
+# First leaderboard page kept in memory. Writes changing cups, nicknames or
+# photos through this process drop it; the TTL bounds how stale it gets
+# from the writes of other instances
+TOP_LEADERBOARD_TTL = 30.0
+top_leaderboard = {"rows": None, "expires": 0.0}
+top_leaderboard_lock = threading.Lock()
+
+
+def get_top_leaderboard():
+    with top_leaderboard_lock:
+        if top_leaderboard["rows"] is None or time.monotonic() > top_leaderboard["expires"]:
+            top_leaderboard["rows"] = leaderboard_page(LEADERBOARD_MAX_LIMIT)
+            top_leaderboard["expires"] = time.monotonic() + TOP_LEADERBOARD_TTL
+        return top_leaderboard["rows"]
+
+
+def invalidate_leaderboard():
+    with top_leaderboard_lock:
+        top_leaderboard["rows"] = None
+
+
+MAX_PHOTO_BYTES = 5 * 1024 * 1024
+# Decoded size cap: a few KB of compressed pixels can expand to gigabytes
+MAX_PHOTO_PIXELS = 4096 * 4096
+THUMBNAIL_SIZE = (128, 128)
+# Larger bodies get a 413 before they are read. Base64 photos grow by a third
+app.config["MAX_CONTENT_LENGTH"] = 2 * MAX_PHOTO_BYTES
+PHOTO_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF8", "image/gif"),
+)
+
+
+def photo_url(photo_hash):
+    return f"/photos/{photo_hash}" if photo_hash else None
+
+
+# Deprecated: the base64 photo of user objects ("photo", "photo_base64" in
+# /users) returned next to photo_url until clients read photo_url. A
+# response loads its photos in one query. LEGACY_PHOTO_FIELDS=0 drops them
+LEGACY_PHOTO_FIELDS = os.getenv("LEGACY_PHOTO_FIELDS", "1") == "1"
+
+
+# {photo_hash: base64 photo} of these hashes
+def legacy_photos(photo_hashes):
+    hashes = {photo_hash for photo_hash in photo_hashes if photo_hash}
+    if not LEGACY_PHOTO_FIELDS or not hashes:
+        return {}
+    rows = db.session.query(Photo.hash, Photo.data).filter(Photo.hash.in_(hashes))
+    return {photo_hash: base64.b64encode(data).decode("ascii") for photo_hash, data in rows}
+
+
+# Set the deprecated field of each user dict, from the photo_hash at the
+# same position
+def add_legacy_photos(users, photo_hashes, field="photo"):
+    if LEGACY_PHOTO_FIELDS:
+        photos = legacy_photos(photo_hashes)
+        for user, photo_hash in zip(users, photo_hashes):
+            user[field] = photos.get(photo_hash)
+    return users
+
+
+def photo_content_type(data):
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, content_type in PHOTO_SIGNATURES:
+        if data.startswith(signature):
+            return content_type
+    return None
+
+
+# JPEG thumbnail of a photo, or None without Pillow or for unreadable images
+# (the full photo is served instead). Images over MAX_PHOTO_PIXELS are
+# refused from their header, before any pixel is decoded
+def make_thumbnail(data):
+    if Image is None:
+        return None
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.width * image.height > MAX_PHOTO_PIXELS:
+            raise Image.DecompressionBombError(f"{image.width}x{image.height} image")
+        image.thumbnail(THUMBNAIL_SIZE)
+        out = io.BytesIO()
+        image.convert("RGB").save(out, format="JPEG", quality=85)
+        return out.getvalue()
+    except Image.DecompressionBombError:
+        abort(400, description=f"Photo must be at most {MAX_PHOTO_PIXELS} pixels")
+    except (OSError, ValueError):
+        return None
+
+
+# Point the user to the photo with these bytes, storing it first if no
+# user has the same photo yet. The previous photo goes once unreferenced
+def set_user_photo(user, data):
+    content_type = photo_content_type(data)
+    if content_type is None:
+        abort(400, description="Photo must be a JPEG, PNG, GIF or WebP image")
+    photo_hash = hashlib.sha256(data).hexdigest()
+    if db.session.get(Photo, photo_hash) is None:
+        db.session.add(Photo(hash=photo_hash, content_type=content_type, data=data, thumbnail=make_thumbnail(data)))
+    old_hash = user.photo_hash
+    user.photo_hash = photo_hash
+    user.photo = None
+    if old_hash and old_hash != photo_hash:
+        db.session.flush()
+        if not User.query.filter_by(photo_hash=old_hash).first():
+            Photo.query.filter_by(hash=old_hash).delete()
+
+
+# SQL statements run by each request, sent back as X-DB-Queries when
+# QUERY_COUNT_HEADER=1: list endpoints must stay at a constant count however
+# many friends or invites a user has
+QUERY_COUNT_HEADER = os.getenv("QUERY_COUNT_HEADER") == "1"
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.db_queries = g.get("db_queries", 0) + 1
+
+
+@app.after_request
+def add_query_count(response):
+    if QUERY_COUNT_HEADER:
+        response.headers["X-DB-Queries"] = str(g.get("db_queries", 0))
+    return response
 
 
 @app.errorhandler(400)
 @app.errorhandler(404)
+@app.errorhandler(413)
 def handle_error(err):
     return jsonify({"error": str(err)}), err.code
 
@@ -184,6 +529,7 @@ def login_user():
         if google_photo_url and user.google_photo_url != google_photo_url:
             user.google_photo_url = google_photo_url
         db.session.commit()
+        invalidate_leaderboard()
         return jsonify(
             {"firebase_code": firebase_code, "nickname": user.nickname, "created": False}
         )
@@ -195,6 +541,7 @@ def login_user():
     )
     db.session.add(user)
     db.session.commit()
+    invalidate_leaderboard()
     return jsonify({"firebase_code": firebase_code, "nickname": nickname, "created": True}), 201
 
 
@@ -204,35 +551,76 @@ def get_user():
     user = User.query.filter_by(firebase_code=payload["firebase_code"]).first()
     if not user:
         return jsonify({})
-    photo_base64 = None
-    if user.photo is not None:
-        photo_base64 = base64.b64encode(user.photo).decode("ascii")
-    return jsonify(
-        {
-            "id": user.id,
-            "nickname": user.nickname,
-            "firebase_code": user.firebase_code,
-            "friend_code": user.friend_code,
-            "photo_base64": photo_base64,
-            "cups": user.cups
-        }
-    )
-
-
+    data = {
+        "id": user.id,
+        "nickname": user.nickname,
+        "firebase_code": user.firebase_code,
+        "friend_code": user.friend_code,
+        "photo_url": photo_url(user.photo_hash),
+        "cups": user.cups
+    }
+    return jsonify(add_legacy_photos([data], [user.photo_hash], field="photo_base64")[0])
+
+
+# multipart/form-data with "firebase_code" and the raw image as "photo";
+# JSON with "photo_base64" is still accepted from older clients
 @app.post("/users/photo")
 def update_user_photo():
-    payload = parse_json(["firebase_code", "photo_base64"])
-    firebase_code = payload["firebase_code"]
-    try:
-        photo_bytes = base64.b64decode(payload["photo_base64"], validate=True)
-    except (ValueError, TypeError):
-        abort(400, description="Invalid base64 in photo_base64")
+    if request.files:
+        firebase_code = request.form.get("firebase_code")
+        upload = request.files.get("photo")
+        if not firebase_code or upload is None:
+            abort(400, description="Missing fields: firebase_code, photo")
+        photo_bytes = upload.read(MAX_PHOTO_BYTES + 1)
+    else:
+        payload = parse_json(["firebase_code", "photo_base64"])
+        firebase_code = payload["firebase_code"]
+        try:
+            photo_bytes = base64.b64decode(payload["photo_base64"], validate=True)
+        except (ValueError, TypeError):
+            abort(400, description="Invalid base64 in photo_base64")
+    if not photo_bytes or len(photo_bytes) > MAX_PHOTO_BYTES:
+        abort(400, description=f"Photo must be 1 to {MAX_PHOTO_BYTES} bytes")
     user = User.query.filter_by(firebase_code=firebase_code).first()
     if not user:
         abort(404, description="User not found")
-    user.photo = photo_bytes
+    set_user_photo(user, photo_bytes)
     db.session.commit()
-    return jsonify({"firebase_code": user.firebase_code, "updated": True}), 200
+    invalidate_leaderboard()
+    return jsonify({"firebase_code": user.firebase_code, "updated": True, "photo_url": photo_url(user.photo_hash)}), 200
+
+
+# Photo bytes (or ?size=thumb) by content hash, cacheable forever
+@app.get("/photos/<photo_hash>")
+def get_photo(photo_hash):
+    thumb = request.args.get("size") == "thumb"
+    etag = f"{photo_hash}-thumb" if thumb else photo_hash
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "public, max-age=31536000, immutable"}
+    if etag in request.if_none_match:
+        # Not modified only while the photo exists
+        if db.session.query(Photo.hash).filter(Photo.hash == photo_hash).first() is None:
+            abort(404, description="Photo not found")
+        return Response(status=304, headers=headers)
+
+    # A stored thumbnail is served without reading the full photo
+    if thumb:
+        row = db.session.query(Photo.thumbnail).filter(Photo.hash == photo_hash).first()
+        if row is None:
+            abort(404, description="Photo not found")
+        if row.thumbnail is not None:
+            return Response(row.thumbnail, mimetype="image/jpeg", headers=headers)
+
+    row = db.session.query(Photo.content_type, Photo.data).filter(Photo.hash == photo_hash).first()
+    if row is None:
+        abort(404, description="Photo not found")
+    if thumb:
+        # Photos copied from USERS by migration 004 get their thumbnail here
+        thumbnail = make_thumbnail(row.data)
+        if thumbnail is not None:
+            Photo.query.filter_by(hash=photo_hash).update({"thumbnail": thumbnail})
+            db.session.commit()
+            return Response(thumbnail, mimetype="image/jpeg", headers=headers)
+    return Response(row.data, mimetype=row.content_type, headers=headers)
 
 
 @app.post("/users/nickname")
@@ -244,6 +632,7 @@ def update_user_nickname():
         abort(404, description="User not found")
     user.nickname = payload["nickname"]
     db.session.commit()
+    invalidate_leaderboard()
     return jsonify({"firebase_code": user.firebase_code, "updated": user.nickname}), 200
 
 
@@ -253,46 +642,15 @@ def get_user_stats():
     user = User.query.filter_by(firebase_code=payload["firebase_code"]).first()
     if not user:
         abort(404, description="User not found")
-        ordered_ids = [u.id for u in User.query.filter(User.id != 1).order_by(User.cups.desc(), User.id.asc()).all()]
-    ordered_ids = [u.id for u in User.query.filter(User.id != 1).order_by(User.cups.desc(), User.id.asc()).all()]
-    global_rank = ordered_ids.index(user.id) + 1
-
-    def build_stats(mode):
-        matches = Match.query.filter(
-            Match.mode == mode,
-            or_(Match.host_id == user.id, Match.joiner_id == user.id),
-        ).order_by(Match.createdAt.desc()).all()
-        total_games = len(matches)
-        wins = 0
-        win_streak = 0
-        for match in matches:
-            if match.host_id == user.id and match.host_points > match.joiner_points:
-                wins += 1
-            elif match.joiner_id == user.id and match.joiner_points > match.host_points:
-                wins += 1
-        if matches:
-            for match in matches:
-                is_win = False
-                if match.host_id == user.id and match.host_points > match.joiner_points:
-                    is_win = True
-                elif match.joiner_id == user.id and match.joiner_points > match.host_points:
-                    is_win = True
-                if is_win:
-                    win_streak += 1
-                else:
-                    break
-        win_rate = (wins / total_games) if total_games else 0
-        return {
-            "total_win": wins,
-            "win_streak": win_streak,
-            "win_rate": win_rate,
-            "total_game_played": total_games,
-        }
+    global_rank = get_global_rank(user)
+
+    stats = {row.mode: row.to_dict() for row in UserStats.query.filter_by(user_id=user.id)}
+    empty = UserStats(games=0, wins=0, win_streak=0).to_dict()
 
     return jsonify(
         {
-            "cpu": build_stats("cpu"),
-            "online": build_stats("online"),
+            "cpu": stats.get("cpu", empty),
+            "online": stats.get("online", empty),
             "cups": user.cups,
             "global_rank": global_rank,
         }
@@ -318,13 +676,37 @@ def memory():
         cups_to_add = max_cups
     user.cups = (user.cups or 0) + cups_to_add
     db.session.commit()
+    invalidate_leaderboard()
     return jsonify({"cups": cups_to_add}), 200
 
 # Leaderboards
+# Without parameters: every user (legacy clients). With ?limit (at most
+# 100) and/or ?cursor (the "next_cursor" of the previous page): one page,
+# the first one served from memory
 @app.get("/leaderboard/global")
 def global_leaderboard():
-    users = User.query.filter(User.id != 1).order_by(User.cups.desc(), User.id.asc()).all()
-    return jsonify({"leaderboard": [u.to_dict() for u in users]})
+    if "limit" not in request.args and "cursor" not in request.args:
+        users = User.query.filter(User.id != 1).order_by(User.cups.desc(), User.id.asc()).all()
+        leaderboard = add_legacy_photos([u.to_dict() for u in users], [u.photo_hash for u in users])
+        return jsonify({"leaderboard": leaderboard})
+
+    try:
+        limit = int(request.args.get("limit", LEADERBOARD_MAX_LIMIT))
+        after = None
+        if request.args.get("cursor"):
+            cups, user_id = request.args["cursor"].split(":")
+            after = (int(cups), int(user_id))
+    except ValueError:
+        abort(400, description="Invalid limit or cursor")
+    if limit < 1 or limit > LEADERBOARD_MAX_LIMIT:
+        abort(400, description=f"limit must be between 1 and {LEADERBOARD_MAX_LIMIT}")
+
+    if after is None:
+        rows = get_top_leaderboard()[:limit]
+    else:
+        rows = leaderboard_page(limit, after)
+    next_cursor = f"{rows[-1]['cups']}:{rows[-1]['id']}" if len(rows) == limit else None
+    return jsonify({"leaderboard": rows, "next_cursor": next_cursor})
 
 
 @app.post("/leaderboard/friends")
@@ -333,16 +715,17 @@ def friends_leaderboard():
     user = get_user_by_firebase(payload["firebase_code"])
     if not user:
         abort(404, description="User not found")
-    friendships = Friendship.query.filter_by(user_id=user.id, status="accepted").all()
-    friend_ids = [f.friend_id for f in friendships]
-    leaderboard_ids = set(friend_ids)
-    leaderboard_ids.add(user.id)
-    leaderboard = (
-        User.query.filter(User.id.in_(leaderboard_ids))
-        .order_by(User.cups.desc(), User.id.asc())
-        .all()
+    # The user's own row (with current cups) and the friends' in one query
+    own = db.session.query(*PROFILE_COLUMNS).filter(User.id == user.id)
+    friends = (
+        db.session.query(*PROFILE_COLUMNS)
+        .join(Friendship, Friendship.friend_id == User.id)
+        .filter(Friendship.user_id == user.id, Friendship.status == "accepted")
     )
-    return jsonify({"leaderboard": [u.to_dict() for u in leaderboard]})
+    rows = own.union_all(friends).all()
+    leaderboard = add_legacy_photos([profile_dict(row) for row in rows], [row.photo_hash for row in rows])
+    leaderboard.sort(key=lambda u: (-u["cups"], u["id"]))
+    return jsonify({"leaderboard": leaderboard})
 
 
 @app.post("/users/hitthesuit")
@@ -363,6 +746,7 @@ def hit_the_suit():
         cups_to_add = max_cups
     user.cups = (user.cups or 0) + cups_to_add
     db.session.commit()
+    invalidate_leaderboard()
     return jsonify({"cups": cups_to_add}), 200
 
 # Friendships
@@ -370,7 +754,7 @@ def hit_the_suit():
 def request_friendship():
     payload = parse_json(["requester_firebase_code", "addressee_friend_code"])
     requester = get_user_by_firebase(payload["requester_firebase_code"])
-    addressee = User.query.filter_by(friend_code=payload["addressee_friend_code"]).first()
+    addressee = get_user_by_friend_code(payload["addressee_friend_code"])
     if not requester or not addressee:
         abort(404, description="User not found")
     if requester.id == addressee.id:
@@ -419,14 +803,14 @@ def list_friendships():
     user = get_user_by_firebase(firebase_code)
     if not user:
         return jsonify({"friends":[]})
-    friendships = Friendship.query.filter_by(
-        user_id=user.id, status=status
-    ).all()
-    friend_ids = [f.friend_id for f in friendships]
-    if not friend_ids:
-        return jsonify({"friends":[]})
-    friends = User.query.filter(User.id.in_(friend_ids)).all()
-    return jsonify({"friends": [u.to_dict() for u in friends]})
+    friends = (
+        db.session.query(*PROFILE_COLUMNS)
+        .join(Friendship, Friendship.friend_id == User.id)
+        .filter(Friendship.user_id == user.id, Friendship.status == status)
+        .all()
+    )
+    users = add_legacy_photos([profile_dict(row) for row in friends], [row.photo_hash for row in friends])
+    return jsonify({"friends": users})
 
 
 @app.put("/friendships/status")
@@ -471,8 +855,8 @@ def create_match():
     if payload["mode"] == "cpu":
         host = User.query.filter_by(id=1).first()
     else: 
-        host = User.query.filter_by(firebase_code=payload["host_firebase_code"]).first()
-    joiner = User.query.filter_by(firebase_code=payload["joiner_firebase_code"]).first()
+        host = get_user_by_firebase(payload["host_firebase_code"])
+    joiner = get_user_by_firebase(payload["joiner_firebase_code"])
     if not host or not joiner:
         abort(404, description="User not found")
     host_id = host.id
@@ -494,6 +878,8 @@ def create_match():
     )
     db.session.add(match)
     try:
+        db.session.flush()
+        record_match_stats(match)
         db.session.commit()
     except IntegrityError:
         db.session.rollback()
@@ -517,6 +903,7 @@ def create_match():
             cups_to_add = secrets.randbelow(7) + 27
             winner.cups = (winner.cups or 0) + cups_to_add
             db.session.commit()
+            invalidate_leaderboard()
     return jsonify({"match": match.to_dict(), "added": True}), 201
 
 # Match invites
@@ -546,22 +933,22 @@ def list_match_invites():
     user = get_user_by_firebase(payload["firebase_code"])
     if not user:
         return jsonify([])
-    invites = MatchInvite.query.filter_by(
-        invitee_id=user.id, status="pending"
-    ).all()
+    # Inviters come with their invites, one row each
+    rows = (
+        db.session.query(MatchInvite, User.nickname, User.photo_hash, User.google_photo_url)
+        .outerjoin(User, User.id == MatchInvite.inviter_id)
+        .filter(MatchInvite.invitee_id == user.id, MatchInvite.status == "pending")
+        .all()
+    )
     results = []
-    for invite in invites:
+    photos = legacy_photos(photo_hash for _, _, photo_hash, _ in rows)
+    for invite, nickname, photo_hash, google_photo_url in rows:
         data = invite.to_dict()
-        inviter = User.query.get(invite.inviter_id)
-        if inviter:
-            inviter_data = inviter.to_dict()
-            data["nickname"] = inviter_data.get("nickname")
-            data["photo"] = inviter_data.get("photo")
-            data["google_photo_url"] = inviter_data.get("google_photo_url")
-        else:
-            data["nickname"] = None
-            data["photo"] = None
-            data["google_photo_url"] = None
+        data["nickname"] = nickname
+        data["photo_url"] = photo_url(photo_hash)
+        if LEGACY_PHOTO_FIELDS:
+            data["photo"] = photos.get(photo_hash)
+        data["google_photo_url"] = google_photo_url
         results.append(data)
     return jsonify({"invites": results})
 
@@ -1,60 +1,472 @@
+import hmac
+import json
 import os
-import torch
-from torch import nn
-from flask import Flask, jsonify, request
-from google.cloud import storage
-
-class DQN(nn.Module):
-    def __init__(self, state_dim: int, num_actions: int):
-        super().__init__()
-        self.net = nn.Sequential(
-            nn.Linear(state_dim, 64),
-            nn.ReLU(),
-            nn.Linear(64, 64),
-            nn.ReLU(),
-            nn.Linear(64, num_actions)
-        )
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from flask import Flask, Response, g, jsonify, request
+
+# Only needed by the "gcs" weights backend
+try:
+    from google.cloud import storage
+except ImportError:
+    storage = None
 
-    def forward(self, x):
-        return self.net(x)
+from batching import MicroBatcher
+from decision_cache import DecisionCache, canonical_key
+from metrics import Metrics
+import card_protocol
+from sessions import SessionStore, is_card_id, validate_new_session
 
+# "torch" serves the .pth weights, "numpy" the .npz ones written by
+# src/export.py without importing torch at all
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+if INFERENCE_BACKEND == "numpy":
+    import numpy_backend as backend
+else:
+    import torch_backend as backend
 
-STATE_DIM = 26
 NUM_ACTIONS = 3
+STATE_DIMS = {"plain": 26, "aug": 66}
 
 BUCKET_NAME = "brisgo_agent_bucket"        
-MODEL_FILES = {
-    "medium": ("dqn_briscola.pth", "/tmp/dqn_briscola.pth"),
-    "hard": ("dqn_briscola_hard.pth", "/tmp/dqn_briscola_hard.pth"),
-}
+DOWNLOAD_DIR = "/tmp/brisgo_models"
+
+# The registry manifest (models.json) maps every difficulty to its weights
+# file, version, observation encoding ("plain" or "aug", see
+# env.core.encode_state) and hidden layer width. It is read from the weights
+# backend, so a new model only needs a new manifest and POST /admin/reload
+MANIFEST_NAME = os.getenv("MODEL_MANIFEST", "models.json")
+BUNDLED_MANIFEST = os.path.join(os.path.dirname(__file__), "models.json")
+MANIFEST_FIELDS = {"weights": str, "version": str, "encoding": str, "num_nodes": int}
+
+# Weights precision per difficulty, e.g. MODEL_PRECISION="medium=int8,hard=fp16".
+# Difficulties not listed serve the float32 weights, and so do variants that
+# src/quantize.py did not accept (see served_precision)
+MODEL_PRECISION = dict(
+    item.split("=", 1) for item in os.getenv("MODEL_PRECISION", "").split(",") if item
+)
+for _precision in MODEL_PRECISION.values():
+    assert _precision in backend.PRECISIONS, (
+        f"Precision {_precision} not supported by the {INFERENCE_BACKEND} backend"
+    )
+
+# Map the weights read-only from one file per weights version, shared by
+# every worker process (see load_model of the backends)
+SHARED_WEIGHTS = os.getenv("SHARED_WEIGHTS", "1") == "1"
+
+# "gcs" downloads the weights from BUCKET_NAME, "local" reads them from
+# WEIGHTS_DIR (no network needed). The bucket's medium model
+# (dqn_briscola.pth) is not in the repo: src/weights/models.json serves
+# rule_based_500kep.pth as medium instead, so the local backend starts from
+# a plain checkout. Missing files fail the preload, listed in /health
+WEIGHTS_BACKEND = os.getenv("WEIGHTS_BACKEND", "gcs")
+WEIGHTS_DIR = os.getenv("WEIGHTS_DIR", os.path.join(os.path.dirname(__file__), "src", "weights"))
+
+# Weights name for the active inference backend and precision, e.g.
+# dqn_briscola.pth -> dqn_briscola.int8.pth (see src/quantize.py)
+def backend_file(name, precision="fp32"):
+    base = os.path.splitext(name)[0]
+    if precision != "fp32":
+        base += f".{precision}"
+    return base + backend.WEIGHTS_SUFFIX
+
+def model_precision(difficulty):
+    return MODEL_PRECISION.get(difficulty, "fp32")
+
+# Precision a difficulty is served in: the MODEL_PRECISION variant only if
+# the report of src/quantize.py (<name>.quantization.json, next to the
+# weights) accepts it for this backend, float32 otherwise, with a warning
+def served_precision(difficulty, entry):
+    precision = model_precision(difficulty)
+    if precision == "fp32":
+        return precision
+    report_name = os.path.splitext(entry["weights"])[0] + ".quantization.json"
+    try:
+        with open(download_file(entry, report_name)) as f:
+            variants = json.load(f)["variants"]
+        accepted = any(
+            v["backend"] == INFERENCE_BACKEND and v["precision"] == precision and v["accepted"]
+            for v in variants
+        )
+    except Exception as exc:
+        app.logger.warning("%s: no quantization report %s (%s), serving fp32", difficulty, report_name, exc)
+        return "fp32"
+    if not accepted:
+        app.logger.warning("%s: %s %s not accepted by %s, serving fp32", difficulty, INFERENCE_BACKEND, precision, report_name)
+        return "fp32"
+    return precision
+
+def gcs_bucket():
+    if storage is None:
+        raise RuntimeError("google-cloud-storage is required by the gcs weights backend")
+    return storage.Client().bucket(BUCKET_NAME)
 
-def download_weights(blob_name, local_path):
+def validate_manifest(manifest):
+    if not isinstance(manifest, dict) or not manifest:
+        raise ValueError("The manifest must map difficulties to models")
+    for difficulty, entry in manifest.items():
+        if not isinstance(entry, dict):
+            raise ValueError(f"Manifest entry '{difficulty}' must be an object")
+        for field, kind in MANIFEST_FIELDS.items():
+            if not isinstance(entry.get(field), kind):
+                raise ValueError(f"Manifest entry '{difficulty}' needs '{field}' ({kind.__name__})")
+        if entry["encoding"] not in STATE_DIMS:
+            raise ValueError(f"Manifest entry '{difficulty}' has an unknown encoding")
+    return manifest
+
+# The manifest of the weights backend, or the bundled one if it has none
+def read_manifest():
+    text = None
+    if WEIGHTS_BACKEND == "local":
+        path = os.path.join(WEIGHTS_DIR, MANIFEST_NAME)
+        if os.path.exists(path):
+            with open(path) as f:
+                text = f.read()
+    else:
+        blob = gcs_bucket().blob(MANIFEST_NAME)
+        if blob.exists():
+            text = blob.download_as_text()
+    if text is None:
+        with open(BUNDLED_MANIFEST) as f:
+            text = f.read()
+    return validate_manifest(json.loads(text))
+
+# Fail early, naming every missing file, when the local backend lacks
+# weights of the manifest (or their quantized/exported variants)
+def check_local_weights(manifest):
+    if WEIGHTS_BACKEND != "local":
+        return
+    files = {backend_file(entry["weights"], served_precision(d, entry)) for d, entry in manifest.items()}
+    missing = sorted(name for name in files if not os.path.exists(os.path.join(WEIGHTS_DIR, name)))
+    if missing:
+        raise FileNotFoundError(f"Missing weights in {WEIGHTS_DIR}: {', '.join(missing)}")
+
+# Local path of the weights of a manifest entry
+def download_weights(entry, precision="fp32"):
+    return download_file(entry, backend_file(entry["weights"], precision))
+
+# Local path of a file of the weights backend. Downloads are kept per
+# version, so a re-uploaded blob of a new version is never mistaken for the
+# cached old one
+def download_file(entry, blob_name):
+    if WEIGHTS_BACKEND == "local":
+        return os.path.join(WEIGHTS_DIR, blob_name)
+    local_path = os.path.join(DOWNLOAD_DIR, entry["version"], blob_name)
     if os.path.exists(local_path):
-        return  
+        return local_path
+
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    blob = gcs_bucket().blob(blob_name)
+    # Download next to the final path, then rename: a concurrent reader never
+    # sees a partial file
+    blob.download_to_filename(local_path + ".part")
+    os.replace(local_path + ".part", local_path)
+    return local_path
+
+# A loaded model with the manifest fields requests depend on. Requests take
+# one snapshot of it, so the encoding they use always matches the model
+ServedModel = namedtuple("ServedModel", "version encoding precision model")
 
-    client = storage.Client()
-    bucket = client.bucket(BUCKET_NAME)
-    blob = bucket.blob(blob_name)
-    blob.download_to_filename(local_path)
+def load_entry(difficulty, entry):
+    precision = served_precision(difficulty, entry)
+    model = backend.load_model(
+        download_weights(entry, precision),
+        STATE_DIMS[entry["encoding"]],
+        NUM_ACTIONS,
+        precision=precision,
+        num_nodes=entry["num_nodes"],
+        shared=SHARED_WEIGHTS,
+    )
+    warm_up(model, STATE_DIMS[entry["encoding"]])
+    return ServedModel(entry["version"], entry["encoding"], precision, model)
 
-def load_model(blob_name, local_path):
-    download_weights(blob_name, local_path)
-    model = DQN(state_dim=STATE_DIM, num_actions=NUM_ACTIONS)
-    state_dict = torch.load(local_path, map_location="cpu")
-    model.load_state_dict(state_dict)
-    model.eval()
-    return model
+# A dummy forward pass per batch shape, so the first real request does not
+# pay for lazy initialization
+def warm_up(model, dim):
+    for batch_size in (1, BATCHER.max_batch_size):
+        model(np.zeros((batch_size, dim), dtype=np.float32))
 
 app = Flask(__name__)
+# Filled from the manifest by preload_models: reading it may need the
+# network (gcs backend), so it never runs at import
+REGISTRY = {}
 MODEL_CACHE = {}
+MODEL_LOCK = threading.Lock()
+
+# Repeated states (common early-game hands) skip inference entirely
+CACHE = DecisionCache(int(os.getenv("DECISION_CACHE_SIZE", "65536")))
+
+# Request counters and latencies, per stage: parse (JSON, validation and
+# encoding), queue (waiting in the micro-batcher), forward and serialize
+METRICS = Metrics()
+BATCH_SIZE_BOUNDS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 1024, 4096)
+
+def cache_metrics():
+    samples = []
+    for difficulty, stats in CACHE.stats().items():
+        labels = {"difficulty": difficulty}
+        lookups = stats["hits"] + stats["misses"]
+        samples += [
+            ("cache_hits_total", "counter", labels, stats["hits"]),
+            ("cache_misses_total", "counter", labels, stats["misses"]),
+            ("cache_evictions_total", "counter", labels, stats["evictions"]),
+            ("cache_entries", "gauge", labels, stats["size"]),
+            ("cache_hit_ratio", "gauge", labels, stats["hits"] / lookups if lookups else 0.0),
+        ]
+    return samples
+
+METRICS.add_collector(cache_metrics)
+
+@app.before_request
+def start_timer():
+    g.start = time.perf_counter()
+    g.difficulty = "none"
 
+@app.after_request
+def count_request(response):
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    METRICS.inc("requests_total", endpoint=endpoint, difficulty=g.difficulty, status=response.status_code)
+    METRICS.observe("request_duration_seconds", time.perf_counter() - g.start, endpoint=endpoint, difficulty=g.difficulty)
+    return response
+
+# End of the parse stage of a valid request
+def parsed(difficulty):
+    g.difficulty = difficulty
+    METRICS.observe("stage_duration_seconds", time.perf_counter() - g.start, stage="parse", difficulty=difficulty)
+
+def respond(payload):
+    start = time.perf_counter()
+    response = jsonify(payload)
+    METRICS.observe("stage_duration_seconds", time.perf_counter() - start, stage="serialize", difficulty=g.difficulty)
+    return response
+
+def forward(difficulty, served, states):
+    start = time.perf_counter()
+    q_values = served.model(states)
+    METRICS.observe("stage_duration_seconds", time.perf_counter() - start, stage="forward", difficulty=difficulty)
+    return q_values
+
+def record_batch(difficulty, waits):
+    for wait in waits:
+        METRICS.observe("stage_duration_seconds", wait, stage="queue", difficulty=difficulty)
+    METRICS.distribution("batch_size", len(waits), BATCH_SIZE_BOUNDS, difficulty=difficulty, source="batcher")
+
+# Install a (new) model for a difficulty and drop the decisions of the old
+# one. Requests already holding the old ServedModel finish on it. SWAP_LOCK
+# makes the swap and the invalidation atomic for remember()
+SWAP_LOCK = threading.Lock()
+
+def set_model(difficulty, served):
+    with SWAP_LOCK:
+        old = MODEL_CACHE.get(difficulty)
+        MODEL_CACHE[difficulty] = served
+        CACHE.invalidate(difficulty)
+    release_model(old)
+
+def remove_model(difficulty):
+    with SWAP_LOCK:
+        old = MODEL_CACHE.pop(difficulty)
+        CACHE.invalidate(difficulty)
+    release_model(old)
+
+# Delete the shared weights file (numpy backend, see map_shared) of a model
+# swapped out, unless a served model still maps the same weights
+def release_model(old):
+    path = getattr(old.model, "shared_path", None) if old is not None else None
+    if path and all(getattr(s.model, "shared_path", None) != path for s in list(MODEL_CACHE.values())):
+        backend.release_shared(path)
+
+# Preload and reload status reported by /health
+READY = threading.Event()
+PRELOAD_ERROR = None
+RELOAD_LOCK = threading.Lock()
+RELOAD_STATUS = {"status": "idle", "error": None}
+
+# ServedModel of a difficulty (loaded on first use), None if not in the
+# registry. Difficulties come from JSON: lists and objects are not hashable
 def get_model(difficulty):
-    if difficulty not in MODEL_FILES:
+    if not isinstance(difficulty, str) or difficulty not in REGISTRY:
         return None
     if difficulty not in MODEL_CACHE:
-        blob_name, local_path = MODEL_FILES[difficulty]
-        MODEL_CACHE[difficulty] = load_model(blob_name, local_path)
-    return MODEL_CACHE[difficulty]
+        with MODEL_LOCK:
+            entry = REGISTRY.get(difficulty)
+            if entry is not None and difficulty not in MODEL_CACHE:
+                set_model(difficulty, load_entry(difficulty, entry))
+    return MODEL_CACHE.get(difficulty)
+
+# Read the manifest, then fetch, load and warm up every model concurrently
+# (only the manifest with load=False: models then load on first use).
+# Failures are reported by /health
+def preload_models(load=True):
+    global PRELOAD_ERROR, REGISTRY
+    try:
+        registry = read_manifest()
+        with MODEL_LOCK:
+            REGISTRY = registry
+        if not load:
+            READY.set()
+            return
+        check_local_weights(registry)
+        with ThreadPoolExecutor(max_workers=len(registry)) as pool:
+            loaded = dict(zip(registry, pool.map(lambda d: load_entry(d, registry[d]), registry)))
+        with MODEL_LOCK:
+            for difficulty, served in loaded.items():
+                if difficulty not in MODEL_CACHE:
+                    set_model(difficulty, served)
+        READY.set()
+    except Exception as exc:
+        PRELOAD_ERROR = str(exc)
+        app.logger.exception("Model preload failed")
+
+# Load the models whose manifest entry changed while the old ones keep
+# serving, then swap them all in at once
+def reload_models(manifest):
+    global REGISTRY
+    try:
+        check_local_weights(manifest)
+        changed = [d for d in manifest if manifest[d] != REGISTRY.get(d) or d not in MODEL_CACHE]
+        if changed:
+            with ThreadPoolExecutor(max_workers=len(changed)) as pool:
+                loaded = dict(zip(changed, pool.map(lambda d: load_entry(d, manifest[d]), changed)))
+        else:
+            loaded = {}
+        with MODEL_LOCK:
+            for difficulty, served in loaded.items():
+                set_model(difficulty, served)
+            for difficulty in set(MODEL_CACHE) - set(manifest):
+                remove_model(difficulty)
+            REGISTRY = manifest
+        RELOAD_STATUS.update(status="idle", error=None)
+        app.logger.info("Reloaded models: %s", ", ".join(changed) or "none")
+    except Exception as exc:
+        RELOAD_STATUS.update(status="error", error=str(exc))
+        app.logger.exception("Model reload failed")
+    finally:
+        RELOAD_LOCK.release()
+
+# /admin/reload reaches one worker process. It writes the manifest it applies
+# to RELOAD_FILE, in the server's own directory (SHARED_WEIGHTS_DIR, set per
+# server by gunicorn.conf.py), and every worker checks the file's stamp before
+# a request: a worker seeing a new one applies the same manifest itself.
+# Without SHARED_WEIGHTS_DIR the server is one process and nothing is written
+RELOAD_FILE = (
+    os.path.join(os.environ["SHARED_WEIGHTS_DIR"], "reload.json") if os.getenv("SHARED_WEIGHTS_DIR") else None
+)
+RELOAD_SEEN = None
+
+def reload_stamp():
+    try:
+        stat = os.stat(RELOAD_FILE)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+# Called with RELOAD_LOCK held
+def publish_reload(manifest):
+    global RELOAD_SEEN
+    if RELOAD_FILE is None:
+        return
+    os.makedirs(os.path.dirname(RELOAD_FILE), exist_ok=True)
+    # Written under a per-process name, then renamed: workers never read a
+    # partial manifest
+    tmp_path = f"{RELOAD_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, RELOAD_FILE)
+    RELOAD_SEEN = reload_stamp()
+
+@app.before_request
+def follow_reload():
+    global RELOAD_SEEN
+    if RELOAD_FILE is None:
+        return
+    stamp = reload_stamp()
+    if stamp is None or stamp == RELOAD_SEEN or not RELOAD_LOCK.acquire(blocking=False):
+        return
+    # Checked again under the lock: a reload of this stamp may have just ended
+    if reload_stamp() == RELOAD_SEEN:
+        RELOAD_LOCK.release()
+        return
+    try:
+        RELOAD_SEEN = reload_stamp()
+        with open(RELOAD_FILE) as f:
+            manifest = validate_manifest(json.load(f))
+    except (OSError, ValueError) as exc:
+        RELOAD_STATUS.update(status="error", error=f"Could not read {RELOAD_FILE}: {exc}")
+        app.logger.exception("Could not follow a reload")
+        RELOAD_LOCK.release()
+        return
+    RELOAD_STATUS.update(status="loading", error=None)
+    threading.Thread(target=reload_models, args=(manifest,), daemon=True).start()
+
+MAX_BATCH_ENTRIES = int(os.getenv("MAX_BATCH_ENTRIES", "4096"))
+
+# 400 for an unknown difficulty, or 503 while the manifest is not loaded
+def difficulty_error(entries=None):
+    if not REGISTRY:
+        return jsonify({"error": "Models are not loaded yet, see /health"}), 503
+    body = {"error": f"'difficulty' must be one of {sorted(REGISTRY)}"}
+    if entries is not None:
+        body["entries"] = entries
+    return jsonify(body), 400
+
+# Cache a decision unless the model that took it was swapped out meanwhile.
+# Checked and stored under SWAP_LOCK: a swap cannot clear the cache between
+# the check and the put
+def remember(difficulty, served, key, action):
+    if key is None:
+        return
+    with SWAP_LOCK:
+        if MODEL_CACHE.get(difficulty) is served:
+            CACHE.put(difficulty, key, action)
+
+# Batched forward pass used by the micro-batcher: one action per
+# (served model, state) item. Items queued across a model swap are split
+# by model, so each state still meets the model it was encoded for
+def batched_actions(difficulty, items):
+    groups = {}
+    for i, (served, _) in enumerate(items):
+        groups.setdefault(id(served), (served, []))[1].append(i)
+    actions = [0] * len(items)
+    for served, idx in groups.values():
+        q_values = forward(difficulty, served, np.stack([items[i][1] for i in idx]))
+        for i, action in zip(idx, q_values.argmax(axis=1).tolist()):
+            actions[i] = action
+    return actions
+
+# Actions for a (N, state_dim) batch of one difficulty: cached states are
+# answered directly, the others share one forward pass
+def cached_actions(difficulty, served, states):
+    keys = [canonical_key(state) for state in states]
+    actions = [None if key is None else CACHE.get(difficulty, key) for key in keys]
+    misses = [i for i, action in enumerate(actions) if action is None]
+    if misses:
+        computed = forward(difficulty, served, states[misses]).argmax(axis=1).tolist()
+        for i, action in zip(misses, computed):
+            actions[i] = action
+            remember(difficulty, served, keys[i], action)
+    return actions
+
+# float32 array of the given shape, or None if the values are not finite numbers
+def parse_states(values, shape):
+    try:
+        states = np.array(values, dtype=np.float32)
+    except (TypeError, ValueError):
+        return None
+    if states.shape != shape or not np.isfinite(states).all():
+        return None
+    return states
+
+# Concurrent /act calls of the same difficulty share one forward pass
+BATCHER = MicroBatcher(
+    batched_actions,
+    max_batch_size=int(os.getenv("BATCH_MAX_SIZE", "32")),
+    max_wait_us=int(os.getenv("BATCH_MAX_WAIT_US", "500")),
+    on_batch=record_batch,
+)
 
 @app.route("/act", methods=["POST"])
 def act():
@@ -63,28 +475,271 @@ def act():
         return jsonify({"error": "Missing 'state' or 'difficulty' in JSON body"}), 400
 
     difficulty = payload["difficulty"]
-    if difficulty not in MODEL_FILES:
-        return jsonify({"error": "'difficulty' must be 'medium' or 'hard'"}), 400
+    served = get_model(difficulty)
+    if served is None:
+        return difficulty_error()
 
     state = payload["state"]
-    if not isinstance(state, list) or len(state) != STATE_DIM:
-        return jsonify({"error": f"'state' must be a list of length {STATE_DIM}"}), 400
+    dim = STATE_DIMS[served.encoding]
+    if not isinstance(state, list) or len(state) != dim:
+        return jsonify({"error": f"'state' must be a list of length {dim}"}), 400
 
-    try:
-        state_t = torch.tensor(state, dtype=torch.float32).unsqueeze(0)
-    except (TypeError, ValueError):
+    state = parse_states(state, (dim,))
+    if state is None:
         return jsonify({"error": "'state' must be a list of numbers"}), 400
 
-    model = get_model(difficulty)
-    with torch.no_grad():
-        q_values = model(state_t)
-        action = int(torch.argmax(q_values, dim=1).item())
+    parsed(difficulty)
+    return respond({"action": decide(difficulty, served, state)})
+
+# Action for one encoded state: decision cache, then the micro-batcher
+def decide(difficulty, served, state):
+    key = canonical_key(state)
+    action = None if key is None else CACHE.get(difficulty, key)
+    if action is None:
+        action = BATCHER.submit(difficulty, (served, state)).result()
+        remember(difficulty, served, key, action)
+    return action
+
+# Best card of a hand with hand_size cards: with fewer than NUM_ACTIONS the
+# Q-values of the empty slots are masked (as evaluate.select_action does).
+# Those late-game states skip the decision cache, whose entries are
+# unmasked /act answers
+def decide_hand(difficulty, served, state, hand_size):
+    if hand_size >= NUM_ACTIONS:
+        return decide(difficulty, served, state)
+    q_values = np.array(forward(difficulty, served, state[None])[0], dtype=np.float32)
+    q_values[hand_size:] = -1e9
+    return int(q_values.argmax())
+
+# Card ids instead of an encoded state (see card_protocol.py), either as JSON
+# {"difficulty", "cards"} or as a binary body with ?difficulty=. The state is
+# encoded here for the model serving the difficulty, aug models included
+@app.route("/act/cards", methods=["POST"])
+def act_cards():
+    try:
+        if request.mimetype == "application/octet-stream":
+            difficulty = request.args.get("difficulty")
+            cards = card_protocol.parse_binary(request.get_data())
+        else:
+            payload = request.get_json(silent=True)
+            if not payload or "cards" not in payload or "difficulty" not in payload:
+                return jsonify({"error": "Missing 'cards' or 'difficulty' in JSON body"}), 400
+            difficulty = payload["difficulty"]
+            cards = card_protocol.parse_json(payload["cards"])
+        served = get_model(difficulty)
+        if served is None:
+            return difficulty_error()
+        state = cards.encode(served.encoding)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    parsed(difficulty)
+    return respond({"action": decide(difficulty, served, state)})
+
+# Stateful CPU matches: the client opens a session with the briscola card and
+# the agent's first hand, then only sends what the agent cannot know (the
+# opponent's cards and its own draws) and asks for moves
+SESSIONS = SessionStore(
+    ttl_s=int(os.getenv("SESSION_TTL_S", "1800")),
+    max_sessions=int(os.getenv("SESSION_MAX", "10000")),
+)
+
+@app.route("/sessions", methods=["POST"])
+def create_session():
+    payload = request.get_json(silent=True)
+    if not payload or "difficulty" not in payload or "briscola_card" not in payload or "hand" not in payload:
+        return jsonify({"error": "Missing 'difficulty', 'briscola_card' or 'hand' in JSON body"}), 400
+    difficulty = payload["difficulty"]
+    if not isinstance(difficulty, str):
+        return jsonify({"error": "'difficulty' must be a string"}), 400
+    if difficulty not in REGISTRY:
+        return difficulty_error()
+    try:
+        validate_new_session(payload["briscola_card"], payload["hand"])
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    session_id, _ = SESSIONS.create(difficulty, payload["briscola_card"], payload["hand"])
+    return jsonify({"session_id": session_id}), 201
+
+@app.route("/sessions/<session_id>", methods=["GET"])
+def get_session(session_id):
+    session = SESSIONS.get(session_id)
+    if session is None:
+        return jsonify({"error": "Unknown or expired session"}), 404
+    with session.lock:
+        return jsonify(session.to_dict())
+
+@app.route("/sessions/<session_id>", methods=["DELETE"])
+def delete_session(session_id):
+    if not SESSIONS.delete(session_id):
+        return jsonify({"error": "Unknown or expired session"}), 404
+    return "", 204
+
+# Deltas in play order: {"played": id} for an opponent card and/or
+# {"drawn": id} for the agent's draw, or a list of them under "events"
+@app.route("/sessions/<session_id>/events", methods=["POST"])
+def session_events(session_id):
+    session = SESSIONS.get(session_id)
+    if session is None:
+        return jsonify({"error": "Unknown or expired session"}), 404
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({"error": "Missing JSON body"}), 400
+    events = payload.get("events", [payload])
+    if not isinstance(events, list) or not all(isinstance(e, dict) for e in events):
+        return jsonify({"error": "'events' must be a list of objects"}), 400
+    if not all(is_card_id(e[k]) for e in events for k in ("played", "drawn") if k in e):
+        return jsonify({"error": "'played' and 'drawn' must be card ids from 0 to 39"}), 400
+
+    # Valid cards the match state does not allow (already seen, full hand,
+    # out of turn) are conflicts with the session
+    with session.lock:
+        try:
+            for event in events:
+                if "played" in event:
+                    session.played(event["played"])
+                if "drawn" in event:
+                    session.drawn(event["drawn"])
+        except ValueError as exc:
+            return jsonify({"error": str(exc), "session": session.to_dict()}), 409
+        return jsonify(session.to_dict())
+
+# The agent's move: the chosen card is applied to the session right away
+@app.route("/sessions/<session_id>/act", methods=["POST"])
+def session_act(session_id):
+    session = SESSIONS.get(session_id)
+    if session is None:
+        return jsonify({"error": "Unknown or expired session"}), 404
+
+    with session.lock:
+        if not session.hand or session.agent_card is not None:
+            return jsonify({"error": "The agent cannot play now", "session": session.to_dict()}), 409
+        served = get_model(session.difficulty)
+        if served is None:
+            return jsonify({"error": "The session difficulty is no longer served"}), 409
+        state = session.card_state().encode(served.encoding)
+        parsed(session.difficulty)
+        action = decide_hand(session.difficulty, served, state, len(session.hand))
+        card_id = session.play_agent(action)
+        return respond({"action": action, "card": card_id, "session": session.to_dict()})
+
+# Many (difficulty, state) entries in one request, answered in the same order
+@app.route("/act/batch", methods=["POST"])
+def act_batch():
+    payload = request.get_json(silent=True)
+    if not payload or not isinstance(payload.get("entries"), list):
+        return jsonify({"error": "Missing 'entries' list in JSON body"}), 400
+
+    entries = payload["entries"]
+    if not entries or len(entries) > MAX_BATCH_ENTRIES:
+        return jsonify({"error": f"'entries' must contain 1 to {MAX_BATCH_ENTRIES} items"}), 400
+    if not all(isinstance(e, dict) for e in entries):
+        return jsonify({"error": "Each entry must be an object with 'difficulty' and 'state'"}), 400
 
-    return jsonify({"action": action})
+    # Non-string difficulties (lists, objects) are reported like unknown ones
+    difficulties = [e.get("difficulty") for e in entries]
+    served = {d: get_model(d) for d in set(d for d in difficulties if isinstance(d, str))}
+    invalid = [i for i, d in enumerate(difficulties) if not isinstance(d, str) or served.get(d) is None]
+    if invalid:
+        return difficulty_error(invalid)
 
+    groups = {}
+    for difficulty in set(difficulties):
+        idx = [i for i, d in enumerate(difficulties) if d == difficulty]
+
+        # One conversion validates every state of the group at once: ragged or
+        # non numeric lists cannot become a (N, state_dim) float array
+        dim = STATE_DIMS[served[difficulty].encoding]
+        states = parse_states([entries[i].get("state") for i in idx], (len(idx), dim))
+        if states is None:
+            return jsonify({"error": f"Each '{difficulty}' state must be a list of {dim} numbers"}), 400
+        groups[difficulty] = (idx, states)
+    parsed(difficulties[0] if len(groups) == 1 else "mixed")
+
+    actions = [0] * len(entries)
+    q_out = [None] * len(entries) if payload.get("q_values") else None
+    for difficulty, (idx, states) in groups.items():
+        METRICS.distribution("batch_size", len(idx), BATCH_SIZE_BOUNDS, difficulty=difficulty, source="endpoint")
+        if q_out is None:
+            for i, action in zip(idx, cached_actions(difficulty, served[difficulty], states)):
+                actions[i] = action
+            continue
+        # Q-values are not cached: the whole group goes through the model
+        q_values = forward(difficulty, served[difficulty], states)
+        for i, action, q in zip(idx, q_values.argmax(axis=1).tolist(), q_values.tolist()):
+            actions[i] = action
+            q_out[i] = q
+
+    response = {"actions": actions}
+    if q_out is not None:
+        response["q_values"] = q_out
+    return respond(response)
+
+# Ready only once every model is loaded and warmed up
 @app.route("/health", methods=["GET"])
 def health():
-    return jsonify({"status": "ok"})
+    if not READY.is_set():
+        status = "error" if PRELOAD_ERROR else "loading"
+        return jsonify({"status": status, "error": PRELOAD_ERROR}), 503
+    return jsonify({
+        "status": "ok",
+        "models": {
+            difficulty: {"version": served.version, "encoding": served.encoding, "precision": served.precision}
+            for difficulty, served in sorted(MODEL_CACHE.items())
+        },
+        "reload": RELOAD_STATUS,
+        "cache": CACHE.stats(),
+    })
+
+# Prometheus text format. Every worker process has its own metrics
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
+
+# Re-read the manifest and hot-swap the models that changed, in every worker
+# (see follow_reload). Loading runs in the background (poll /health), the
+# old models serve until the swap.
+# Disabled unless ADMIN_TOKEN is set; send it as "Authorization: Bearer ..."
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+@app.route("/admin/reload", methods=["POST"])
+def admin_reload():
+    token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    if not ADMIN_TOKEN or not hmac.compare_digest(token, ADMIN_TOKEN):
+        return jsonify({"error": "Forbidden"}), 403
+    try:
+        manifest = read_manifest()
+    except ValueError as exc:
+        return jsonify({"error": f"Invalid manifest: {exc}"}), 400
+    except Exception as exc:
+        # Storage errors: missing client library, credentials, network...
+        app.logger.exception("Could not read the manifest")
+        return jsonify({"error": f"Could not read the manifest: {exc}"}), 503
+
+    if not RELOAD_LOCK.acquire(blocking=False):
+        return jsonify({"error": "A reload is already running"}), 409
+    try:
+        publish_reload(manifest)
+    except OSError as exc:
+        RELOAD_LOCK.release()
+        app.logger.exception("Could not publish the reload to the other workers")
+        return jsonify({"error": f"Could not publish the reload: {exc}"}), 503
+    RELOAD_STATUS.update(status="loading", error=None)
+    threading.Thread(target=reload_models, args=(manifest,), daemon=True).start()
+    return jsonify({"status": "loading", "versions": {d: e["version"] for d, e in manifest.items()}}), 202
+
+# Preload in the background so the server answers /health while loading.
+# "sync" loads before the import returns: with gunicorn's preload_app (see
+# gunicorn.conf.py) the master loads once and the workers fork with the models.
+# "0" only reads the manifest (in the background too) and loads models lazily
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "1")
+if PRELOAD_MODELS == "sync":
+    preload_models()
+elif PRELOAD_MODELS == "1":
+    threading.Thread(target=preload_models, daemon=True).start()
+else:
+    threading.Thread(target=preload_models, kwargs={"load": False}, daemon=True).start()
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=8080, debug=False)
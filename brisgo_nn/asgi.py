@@ -0,0 +1,157 @@
+import asyncio
+import io
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import HTTPException
+
+import app as inference
+
+# Asyncio serving mode: uvicorn asgi:app (or gunicorn -k
+# uvicorn.workers.UvicornWorker asgi:app). The event loop only accepts
+# connections and reads bodies; every request then runs the Flask app (same
+# routes, get_model, decision cache and micro-batcher) on a bounded thread
+# pool. Admission control keeps latency bounded under bursts:
+#   - at most MAX_QUEUE_DEPTH requests are admitted (running or waiting for
+#     a thread), the next ones get an immediate 503
+#   - a request that waited more than MAX_QUEUE_WAIT_MS for a thread is
+#     answered 503 without running: its client has likely given up already
+# /health and /metrics are never shed and run on their own threads, so
+# probes keep working while every inference thread is busy
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "8"))
+MAX_QUEUE_DEPTH = int(os.getenv("MAX_QUEUE_DEPTH", "64"))
+MAX_QUEUE_WAIT = int(os.getenv("MAX_QUEUE_WAIT_MS", "250")) / 1000.0
+UNSHED_PATHS = ("/health", "/metrics")
+
+EXECUTOR = ThreadPoolExecutor(max_workers=INFERENCE_THREADS, thread_name_prefix="inference")
+PROBE_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="probe")
+IN_FLIGHT = 0
+
+def queue_metrics():
+    return [
+        ("queue_depth", "gauge", {}, IN_FLIGHT),
+        ("queue_capacity", "gauge", {}, MAX_QUEUE_DEPTH),
+    ]
+
+inference.METRICS.add_collector(queue_metrics)
+
+def wsgi_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            environ[name] = value
+            continue
+        key = f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+# Run the Flask app on one request, in an executor thread. Returns
+# (status, headers, body), or None when the request waited too long
+def run_wsgi(environ, admitted, shed):
+    if shed and time.perf_counter() - admitted > MAX_QUEUE_WAIT:
+        return None
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = headers
+
+    result = inference.app(environ, start_response)
+    try:
+        body = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return response["status"], response["headers"], body
+
+async def send_response(send, status, headers, body):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+# Route template of a request, the endpoint label of app.count_request: raw
+# paths (session ids, scanners) would add a metric series each
+def endpoint_label(scope):
+    adapter = inference.app.url_map.bind(scope.get("server", ("localhost",))[0])
+    try:
+        rule, _ = adapter.match(scope["path"], method=scope["method"], return_rule=True)
+    except HTTPException:
+        return "unmatched"
+    return rule.rule
+
+async def overloaded(send, scope, reason):
+    inference.METRICS.inc("shed_total", endpoint=endpoint_label(scope), reason=reason)
+    body = f'{{"error": "Overloaded ({reason}), retry later"}}'.encode()
+    await send_response(send, 503, [("Content-Type", "application/json"), ("Retry-After", "1")], body)
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            EXECUTOR.shutdown(wait=False)
+            PROBE_EXECUTOR.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    global IN_FLIGHT
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    shed = scope["path"] not in UNSHED_PATHS
+    if shed and IN_FLIGHT >= MAX_QUEUE_DEPTH:
+        return await overloaded(send, scope, "queue_full")
+
+    # Admitted: read the body, then wait for an inference thread (probes
+    # are not counted in the queue depth)
+    IN_FLIGHT += shed
+    try:
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+
+        environ = wsgi_environ(scope, b"".join(chunks))
+        loop = asyncio.get_running_loop()
+        executor = EXECUTOR if shed else PROBE_EXECUTOR
+        result = await loop.run_in_executor(executor, run_wsgi, environ, time.perf_counter(), shed)
+    finally:
+        IN_FLIGHT -= shed
+
+    if result is None:
+        return await overloaded(send, scope, "queue_timeout")
+    await send_response(send, *result)
@@ -0,0 +1,68 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+# Coalesces concurrent single-state requests into batched forward passes.
+# Every key (difficulty) has its own queue and flusher thread: a batch is
+# flushed as soon as it holds max_batch_size states or max_wait_us after its
+# first state arrived, and each caller gets its own row of the result back
+# through a Future. It only pays off when requests are served concurrently,
+# e.g. gunicorn with --threads.
+class MicroBatcher:
+
+    def __init__(self, forward, max_batch_size=32, max_wait_us=500, on_batch=None):
+        # forward(key, states) -> one result per state, in order
+        self.forward = forward
+        # on_batch(key, waits): queue wait in seconds of every state of a
+        # batch about to be forwarded (its length is the batch size)
+        self.on_batch = on_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_us / 1e6
+        self.queues = {}
+        self.lock = threading.Lock()
+
+    def submit(self, key, state) -> Future:
+        future = Future()
+        self._queue(key).put((state, future, time.perf_counter()))
+        return future
+
+    def _queue(self, key):
+        q = self.queues.get(key)
+        if q is None:
+            with self.lock:
+                q = self.queues.get(key)
+                if q is None:
+                    q = queue.Queue()
+                    threading.Thread(target=self._run, args=(key, q), daemon=True).start()
+                    self.queues[key] = q
+        return q
+
+    def _run(self, key, q):
+        while True:
+            batch = [q.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(q.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._flush(key, batch)
+
+    def _flush(self, key, batch):
+        if self.on_batch is not None:
+            now = time.perf_counter()
+            self.on_batch(key, [now - submitted for _, _, submitted in batch])
+        states = [state for state, _, _ in batch]
+        try:
+            results = self.forward(key, states)
+        except Exception as exc:
+            for _, future, _ in batch:
+                future.set_exception(exc)
+            return
+        for (_, future, _), result in zip(batch, results):
+            future.set_result(result)
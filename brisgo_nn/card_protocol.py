@@ -0,0 +1,94 @@
+import os
+import struct
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(__file__), "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+from env.cards import SUITS, card_from_id
+from env.core import deck_seen_from_ids, encode_state
+
+# Compact request describing the agent's view with card ids (0-39, see
+# Card.id) instead of an encoded state:
+#   JSON:   {"hand": [ids], "table": id|null, "briscola": suit|0-3,
+#            "step": int, "points": int, "seen": 40 bit mask}
+#   binary: 3 hand ids, table id, briscola suit index, step, points (one
+#           unsigned byte each, 255 = no card) + seen as uint64, little endian
+BINARY = struct.Struct("<7BQ")
+NO_CARD = 255
+
+CARDS = [card_from_id(card_id) for card_id in range(40)]
+
+
+# Validated view of the agent: the inputs of env.core.encode_state
+class CardState:
+
+    def __init__(self, hand, table, briscola, step, points, seen):
+        if not isinstance(hand, list) or len(hand) > 3:
+            raise ValueError("'hand' must be a list of at most 3 card ids")
+        for card_id in hand + ([] if table is None else [table]):
+            if not isinstance(card_id, int) or not 0 <= card_id < 40:
+                raise ValueError("Card ids must be integers from 0 to 39")
+        if len(set(hand + ([] if table is None else [table]))) != len(hand) + (table is not None):
+            raise ValueError("Card ids must be distinct")
+        if isinstance(briscola, int) and 0 <= briscola < len(SUITS):
+            briscola = SUITS[briscola]
+        if briscola not in SUITS:
+            raise ValueError(f"'briscola' must be one of {SUITS} or its index")
+        if not isinstance(step, int) or not 0 <= step <= 20:
+            raise ValueError("'step' must be an integer from 0 to 20")
+        if not isinstance(points, int) or not 0 <= points <= 120:
+            raise ValueError("'points' must be an integer from 0 to 120")
+        if seen is not None and (not isinstance(seen, int) or not 0 <= seen < 1 << 40):
+            raise ValueError("'seen' must be a 40 bit mask of card ids")
+
+        self.hand = hand
+        self.table = table
+        self.briscola = briscola
+        self.step = step
+        self.points = points
+        self.seen = seen
+
+    # Float32 state for the "plain" (26) or "aug" (66) encoding
+    def encode(self, encoding):
+        deck_seen = None
+        if encoding == "aug":
+            if self.seen is None:
+                raise ValueError("'seen' is required by this difficulty")
+            deck_seen = deck_seen_from_ids(i for i in range(40) if self.seen >> i & 1)
+        return encode_state(
+            self.step,
+            self.points,
+            [CARDS[card_id] for card_id in self.hand],
+            None if self.table is None else CARDS[self.table],
+            self.briscola,
+            deck_seen,
+        )
+
+
+def parse_json(obj):
+    if not isinstance(obj, dict):
+        raise ValueError("'cards' must be an object")
+    missing = [f for f in ("hand", "briscola", "step", "points") if f not in obj]
+    if missing:
+        raise ValueError(f"Missing fields in 'cards': {', '.join(missing)}")
+    return CardState(
+        obj["hand"], obj.get("table"), obj["briscola"], obj["step"], obj["points"], obj.get("seen")
+    )
+
+
+def parse_binary(body: bytes):
+    if len(body) != BINARY.size:
+        raise ValueError(f"Binary body must be {BINARY.size} bytes")
+    h0, h1, h2, table, briscola, step, points, seen = BINARY.unpack(body)
+    hand = [card_id for card_id in (h0, h1, h2) if card_id != NO_CARD]
+    if hand != [h0, h1, h2][:len(hand)]:
+        raise ValueError("Empty hand slots must come last")
+    return CardState(hand, None if table == NO_CARD else table, briscola, step, points, seen)
+
+
+def pack_binary(hand, table, briscola, step, points, seen=0):
+    slots = list(hand) + [NO_CARD] * (3 - len(hand))
+    table = NO_CARD if table is None else table
+    return BINARY.pack(*slots, table, SUITS.index(briscola), step, points, seen)
@@ -0,0 +1,63 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Every value of the state encoding (step/20, points/120, rank/9, 0/1 flags)
+# is a multiple of 1/360, so scaling by 360 gives exact small integers
+GRID = 360.0
+
+
+# Canonical cache key of a float32 state, or None when the state is not a
+# valid encoding (off the grid): such states are always forwarded to the model
+def canonical_key(state: np.ndarray):
+    scaled = np.rint(state * GRID)
+    if np.abs(scaled - state * GRID).max() > 1e-3:
+        return None
+    return scaled.astype(np.int16).tobytes()
+
+
+# Bounded LRU map from canonical state to action, one per difficulty so a
+# model swap only drops the decisions of that model
+class DecisionCache:
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.entries = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def _counters(self, difficulty):
+        return self.counters.setdefault(difficulty, {"hits": 0, "misses": 0, "evictions": 0})
+
+    def get(self, difficulty, key):
+        with self.lock:
+            entries = self.entries.get(difficulty)
+            if entries is not None and key in entries:
+                entries.move_to_end(key)
+                self._counters(difficulty)["hits"] += 1
+                return entries[key]
+            self._counters(difficulty)["misses"] += 1
+            return None
+
+    def put(self, difficulty, key, action):
+        if self.capacity <= 0:
+            return
+        with self.lock:
+            entries = self.entries.setdefault(difficulty, OrderedDict())
+            entries[key] = action
+            entries.move_to_end(key)
+            if len(entries) > self.capacity:
+                entries.popitem(last=False)
+                self._counters(difficulty)["evictions"] += 1
+
+    def invalidate(self, difficulty):
+        with self.lock:
+            self.entries.pop(difficulty, None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                difficulty: dict(counters, size=len(self.entries.get(difficulty, ())))
+                for difficulty, counters in self.counters.items()
+            }
@@ -0,0 +1,41 @@
+import os
+import shutil
+import tempfile
+
+# gunicorn -c gunicorn.conf.py app:app
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+# One worker process with threads: match sessions (/sessions, see
+# sessions.py) live in the worker's memory, so every call of a session must
+# reach the same process. Scale out with GUNICORN_THREADS and instances
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+# Import the app and load every model once in the master, before forking:
+# workers start ready and share the mapped weights (SHARED_WEIGHTS). Models
+# loaded later by a worker (lazy loads, /admin/reload) map the same shared
+# files, so memory stays flat in the number of workers
+preload_app = True
+os.environ.setdefault("PRELOAD_MODELS", "sync")
+
+# Shared weights files of this server (numpy backend) and the manifest of its
+# last /admin/reload (followed by every worker, see app.follow_reload) go to
+# their own tmpfs directory, removed when the master exits. Swapped out
+# models remove their weights files on reload
+OWN_SHARED_DIR = "SHARED_WEIGHTS_DIR" not in os.environ
+if OWN_SHARED_DIR:
+    _tmpfs = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    os.environ["SHARED_WEIGHTS_DIR"] = os.path.join(_tmpfs, f"brisgo-weights-{os.getpid()}")
+
+
+def when_ready(server):
+    if server.cfg.workers > 1:
+        server.log.warning(
+            "%d workers: match sessions are per worker, /sessions calls reaching "
+            "another worker get 404. Use WEB_CONCURRENCY=1 when clients use sessions",
+            server.cfg.workers,
+        )
+
+
+def on_exit(server):
+    if OWN_SHARED_DIR:
+        shutil.rmtree(os.environ["SHARED_WEIGHTS_DIR"], ignore_errors=True)
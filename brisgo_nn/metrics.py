@@ -0,0 +1,155 @@
+import math
+import threading
+
+# Latencies are kept in HDR-style log-linear buckets: every power of two of
+# microseconds is split into SUB_BUCKETS linear buckets, so any quantile is
+# known within 1 / SUB_BUCKETS (~3%) from 1 us to MAX_OCTAVES (~2 minutes)
+SUB_BUCKETS = 32
+MAX_OCTAVES = 27
+QUANTILES = (0.5, 0.9, 0.95, 0.99, 0.999)
+
+
+class LatencyHistogram:
+
+    def __init__(self):
+        self.counts = [0] * ((MAX_OCTAVES + 1) * SUB_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    # frexp gives v = m * 2**e with m in [0.5, 1): e picks the octave, m the
+    # linear bucket inside it
+    def record(self, seconds):
+        us = seconds * 1e6
+        if us < 1.0:
+            index = 0
+        else:
+            m, e = math.frexp(us)
+            index = min(e * SUB_BUCKETS + int((m - 0.5) * 2 * SUB_BUCKETS), len(self.counts) - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+
+    # Upper bound of a bucket, in seconds
+    @staticmethod
+    def bucket_value(index):
+        e, sub = divmod(index, SUB_BUCKETS)
+        return math.ldexp(0.5 + (sub + 1) / (2 * SUB_BUCKETS), e) / 1e6
+
+    def quantile(self, q):
+        if self.count == 0:
+            return math.nan
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.bucket_value(index)
+        return self.bucket_value(len(self.counts) - 1)
+
+
+# Fixed bucket histogram of small values (batch sizes), exported as a
+# Prometheus histogram
+class BucketHistogram:
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def record(self, value):
+        index = 0
+        while index < len(self.bounds) and value > self.bounds[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+# Process-wide counters and histograms, keyed by metric name and labels, and
+# rendered in the Prometheus text format. Recording is a dict lookup and a
+# few integer updates under one lock
+class Metrics:
+
+    def __init__(self, prefix="brisgo"):
+        self.prefix = prefix
+        self.counters = {}
+        self.latencies = {}
+        self.histograms = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(labels.items()))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(labels.items()))
+        with self.lock:
+            histogram = self.latencies.get(key)
+            if histogram is None:
+                histogram = self.latencies[key] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def distribution(self, name, value, bounds, **labels):
+        key = (name, tuple(labels.items()))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = BucketHistogram(bounds)
+            histogram.record(value)
+
+    # collector() -> [(name, type, labels dict, value)], called at render time
+    # for values owned elsewhere (e.g. the decision cache counters)
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self):
+        lines = []
+        typed = set()
+
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                name = f"{self.prefix}_{name}"
+                header(name, "counter")
+                lines.append(f"{name}{format_labels(labels)} {value}")
+
+            # Latencies as summaries: the quantiles come from the full
+            # resolution histogram and cover the process lifetime
+            for (name, labels), histogram in sorted(self.latencies.items()):
+                name = f"{self.prefix}_{name}"
+                header(name, "summary")
+                for q in QUANTILES:
+                    value = histogram.quantile(q)
+                    lines.append(f"{name}{format_labels(labels + (('quantile', q),))} {value:.9f}")
+                lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum:.9f}")
+                lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                name = f"{self.prefix}_{name}"
+                header(name, "histogram")
+                cumulative = 0
+                for bound, count in zip(list(histogram.bounds) + ["+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+
+        for collector in self.collectors:
+            for name, kind, labels, value in collector():
+                name = f"{self.prefix}_{name}"
+                header(name, kind)
+                lines.append(f"{name}{format_labels(tuple(labels.items()))} {value}")
+        return "\n".join(lines) + "\n"
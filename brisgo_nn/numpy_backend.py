@@ -0,0 +1,96 @@
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+
+# Torch-free forward pass of the DQN MLP (Linear/ReLU stack) from the .npz
+# written by src/export.py: arrays w0, b0, w1, b1, ... in layer order, with
+# torch's (out, in) weight layout, or already (in, out) with transposed=True
+class NumpyDQN:
+
+    def __init__(self, weights, biases, dtype=np.float32, transposed=False):
+        # Transposed once so the forward pass is a plain x @ w. Arrays already
+        # in the right layout and dtype are kept as they are (no copy)
+        self.dtype = dtype
+        # Set by load_model when the arrays map a shared file
+        self.shared_path = None
+        self.weights = [np.ascontiguousarray(w if transposed else w.T, dtype=dtype) for w in weights]
+        self.biases = [np.asarray(b, dtype=dtype) for b in biases]
+
+    def __call__(self, states: np.ndarray) -> np.ndarray:
+        x = states.astype(self.dtype, copy=False)
+        last = len(self.weights) - 1
+        for i, (w, b) in enumerate(zip(self.weights, self.biases)):
+            x = x @ w
+            x += b
+            if i < last:
+                np.maximum(x, 0.0, out=x)
+        return x.astype(np.float32, copy=False)
+
+
+# Shared weights: one flat .npy per weights content, in RAM backed tmpfs
+# SHARED_WEIGHTS_DIR is set by gunicorn.conf.py to a per-server directory
+# removed on exit
+SHARED_DIR = os.getenv("SHARED_WEIGHTS_DIR") or ("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+
+
+# Every (in, out) weight and bias packed in one flat array, written once per
+# weights content and then mapped read-only: all the processes serving the
+# same weights share the page cache copy instead of holding their own
+def map_shared(path, weights, biases, dtype):
+    with open(path, "rb") as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:16]
+    name = os.path.splitext(os.path.basename(path))[0]
+    shared_path = os.path.join(SHARED_DIR, f"{name}.{digest}.{np.dtype(dtype).name}.npy")
+
+    if not os.path.exists(shared_path):
+        os.makedirs(SHARED_DIR, exist_ok=True)
+        packed = np.concatenate([a.ravel() for w, b in zip(weights, biases) for a in (w.T, b)])
+        # Written under a per-process name, then renamed: workers starting
+        # together never map a partial file
+        tmp_path = f"{shared_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, packed.astype(dtype))
+        os.replace(tmp_path, shared_path)
+
+    packed = np.load(shared_path, mmap_mode="r")
+    views, offset = [], 0
+    for w, b in zip(weights, biases):
+        for shape in (w.T.shape, b.shape):
+            size = int(np.prod(shape))
+            views.append(packed[offset:offset + size].reshape(shape))
+            offset += size
+    return views[0::2], views[1::2], shared_path
+
+
+# Remove a shared weights file once no model of this process uses it: the
+# processes still mapping it keep their pages until they drop the model,
+# and a process loading the same weights again writes a new copy
+def release_shared(shared_path):
+    try:
+        os.unlink(shared_path)
+    except FileNotFoundError:
+        pass
+
+
+WEIGHTS_SUFFIX = ".npz"
+# int8 dynamic quantization is only available with the torch backend
+PRECISIONS = ("fp32", "fp16")
+
+def load_model(path, state_dim, num_actions, precision="fp32", num_nodes=None, shared=False):
+    assert precision in PRECISIONS, f"Precision {precision} is not supported by the numpy backend"
+    with np.load(path) as data:
+        num_layers = len([k for k in data.files if k.startswith("w")])
+        weights = [data[f"w{i}"] for i in range(num_layers)]
+        biases = [data[f"b{i}"] for i in range(num_layers)]
+    assert weights[0].shape[1] == state_dim, f"{path} expects {weights[0].shape[1]} inputs"
+    assert weights[-1].shape[0] == num_actions, f"{path} has {weights[-1].shape[0]} actions"
+    dtype = np.float16 if precision == "fp16" else np.float32
+    if shared:
+        weights, biases, shared_path = map_shared(path, weights, biases, dtype)
+        model = NumpyDQN(weights, biases, dtype=dtype, transposed=True)
+        model.shared_path = shared_path
+        return model
+    return NumpyDQN(weights, biases, dtype=dtype)
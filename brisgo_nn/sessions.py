@@ -0,0 +1,160 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from card_protocol import CARDS, CardState
+from env.cards import compare_cards
+
+
+# Compact view of a CPU match from the agent's side, updated from small
+# deltas: the server applies the agent's own moves, the client reports the
+# opponent's played cards and the agent's draws. Tricks are solved here with
+# the game rules, so points and step count never travel over the wire.
+class MatchSession:
+
+    def __init__(self, difficulty, briscola_card, hand):
+        self.difficulty = difficulty
+        self.briscola_card = briscola_card
+        self.briscola_suit = CARDS[briscola_card].suit
+        self.hand = list(hand)
+        self.table = None          # opponent card waiting for the agent
+        self.agent_card = None     # agent card waiting for the opponent
+        self.step = 0
+        self.agent_points = 0
+        self.opponent_points = 0
+        # Cards held by the agent or played by anyone, as a bit mask of ids
+        self.used = 0
+        for card_id in self.hand:
+            self.used |= 1 << card_id
+        self.touched = time.monotonic()
+        self.lock = threading.Lock()
+
+    # The agent also knows the briscola card, which is drawn last
+    @property
+    def seen(self):
+        return self.used | 1 << self.briscola_card
+
+    def card_state(self):
+        return CardState(self.hand, self.table, self.briscola_suit, self.step, self.agent_points, self.seen)
+
+    # The agent plays hand[action]: it responds to the table card or leads
+    def play_agent(self, action):
+        if self.agent_card is not None:
+            raise ValueError("The agent already played in this trick")
+        if not 0 <= action < len(self.hand):
+            raise ValueError(f"No card at hand index {action}")
+        card_id = self.hand.pop(action)
+        if self.table is not None:
+            self._solve(self.table, card_id, agent_first=False)
+        else:
+            self.agent_card = card_id
+        return card_id
+
+    def played(self, card_id):
+        self._use(card_id)
+        if self.agent_card is not None:
+            self._solve(self.agent_card, card_id, agent_first=True)
+        elif self.table is None:
+            self.table = card_id
+        else:
+            raise ValueError("The opponent already played in this trick")
+
+    def drawn(self, card_id):
+        if len(self.hand) + (self.agent_card is not None) >= 3:
+            raise ValueError("The agent hand is full")
+        self._use(card_id)
+        self.hand.append(card_id)
+
+    def _use(self, card_id):
+        if not is_card_id(card_id):
+            raise ValueError("Card ids must be integers from 0 to 39")
+        if self.used >> card_id & 1:
+            raise ValueError(f"Card {card_id} was already played or drawn")
+        self.used |= 1 << card_id
+
+    def _solve(self, first_id, second_id, agent_first):
+        first, second = CARDS[first_id], CARDS[second_id]
+        first_wins = compare_cards(first, second, self.briscola_suit) == 0
+        points = first.points + second.points
+        if first_wins == agent_first:
+            self.agent_points += points
+        else:
+            self.opponent_points += points
+        self.table = None
+        self.agent_card = None
+        self.step += 1
+
+    def to_dict(self):
+        return {
+            "difficulty": self.difficulty,
+            "briscola": self.briscola_suit,
+            "hand": self.hand,
+            "table": self.table,
+            "agent_card": self.agent_card,
+            "step": self.step,
+            "agent_points": self.agent_points,
+            "opponent_points": self.opponent_points,
+        }
+
+
+# In-memory sessions ordered by last use: expired ones are always at the
+# front, so eviction only touches what it removes. The size limit only
+# applies when a session is created: reads never drop live sessions.
+# Sessions live in one process: gunicorn.conf.py runs a single worker with
+# threads, so every call of a session reaches it
+class SessionStore:
+
+    def __init__(self, ttl_s=1800, max_sessions=10_000):
+        self.ttl_s = ttl_s
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    # Drop expired sessions, then the least recently used ones until at most
+    # max_size remain
+    def _evict(self, now, max_size=None):
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            full = max_size is not None and len(self.sessions) > max_size
+            if now - session.touched < self.ttl_s and not full:
+                break
+            del self.sessions[session_id]
+
+    def create(self, difficulty, briscola_card, hand):
+        session = MatchSession(difficulty, briscola_card, hand)
+        session_id = secrets.token_urlsafe(12)
+        with self.lock:
+            self._evict(session.touched, max_size=self.max_sessions - 1)
+            self.sessions[session_id] = session
+        return session_id, session
+
+    def get(self, session_id):
+        now = time.monotonic()
+        with self.lock:
+            self._evict(now)
+            session = self.sessions.get(session_id)
+            if session is not None:
+                session.touched = now
+                self.sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id):
+        with self.lock:
+            return self.sessions.pop(session_id, None) is not None
+
+    def __len__(self):
+        return len(self.sessions)
+
+
+def is_card_id(value):
+    return isinstance(value, int) and 0 <= value < 40
+
+
+def validate_new_session(briscola_card, hand):
+    cards = [briscola_card] + (hand if isinstance(hand, list) else [None])
+    if not all(is_card_id(c) for c in cards):
+        raise ValueError("'briscola_card' and 'hand' must be card ids from 0 to 39")
+    if len(hand) != 3 or len(set(cards)) != 4:
+        raise ValueError("'hand' must hold 3 distinct cards, other than the briscola")
+
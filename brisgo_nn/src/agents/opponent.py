@@ -9,8 +9,14 @@ class Opponent:
     
 class RandomOpponent(Opponent):
 
+    # rng is an optional numpy Generator, the global random is used otherwise
+    def __init__(self, rng=None):
+        self.rng = rng
+
     def play(self, hand: List[Card], table_card: Card, briscola_suit: str) -> int:
         assert len(hand) > 0, "Opponent hand is empty"
+        if self.rng is not None:
+            return int(self.rng.integers(len(hand)))
         return random.randrange(len(hand))
 
 
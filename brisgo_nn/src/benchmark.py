@@ -0,0 +1,306 @@
+import argparse
+import json
+import platform
+import random
+import statistics
+import time
+
+import numpy as np
+import torch
+
+from model import DQN, ReplayBuffer
+from train import DQNTrainer
+from env.cards import Deck, compare_cards
+from env.env import BriscolaEnv
+from agents.opponent import RandomOpponent
+from agents.rule_based_agent_v1 import RuleBasedOpponent
+from agents.rule_based_agent_v2 import RuleBasedOpponentV2
+from agents.rule_based_agent_v3 import RuleBasedOpponentV3
+
+# Every benchmark is a factory returning run(n): it performs n operations and
+# returns the nanoseconds spent in the measured call only, so per-op setup
+# (new games, random inputs) stays out of the numbers.
+# benchmarks/baseline.json holds reference numbers (written with --save):
+#   python benchmark.py --compare benchmarks/baseline.json
+# Numbers only compare on the same machine: re-save the baseline there first.
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(factory):
+        BENCHMARKS[name] = factory
+        return factory
+    return register
+
+
+@benchmark("deck_shuffle")
+def bench_deck_shuffle():
+    rng = np.random.default_rng(0)
+
+    def run(n):
+        elapsed = 0
+        for _ in range(n):
+            deck = Deck()
+            t = time.perf_counter_ns()
+            deck.shuffle(rng)
+            elapsed += time.perf_counter_ns() - t
+        return elapsed
+    return run
+
+
+@benchmark("deck_draw")
+def bench_deck_draw():
+    deck = Deck()
+
+    def run(n):
+        elapsed = 0
+        for _ in range(n):
+            if len(deck) == 0:
+                deck.cards = Deck().cards
+            t = time.perf_counter_ns()
+            deck.draw()
+            elapsed += time.perf_counter_ns() - t
+        return elapsed
+    return run
+
+
+@benchmark("compare_cards")
+def bench_compare_cards():
+    rng = random.Random(0)
+    cards = Deck().cards
+    pairs = [(*rng.sample(cards, 2), rng.choice(cards).suit) for _ in range(1024)]
+
+    def run(n):
+        t = time.perf_counter_ns()
+        for i in range(n):
+            compare_cards(*pairs[i % 1024])
+        return time.perf_counter_ns() - t
+    return run
+
+
+def bench_env_reset(aug):
+    def factory():
+        env = BriscolaEnv(aug=aug, seed=0)
+
+        def run(n):
+            t = time.perf_counter_ns()
+            for _ in range(n):
+                env.reset()
+            return time.perf_counter_ns() - t
+        return run
+    return factory
+
+
+def bench_env_step(aug):
+    def factory():
+        env = BriscolaEnv(aug=aug, seed=0)
+        rng = random.Random(0)
+
+        def run(n):
+            elapsed = 0
+            env.reset()
+            for _ in range(n):
+                action = rng.randrange(len(env.agent_hand))
+                t = time.perf_counter_ns()
+                _, _, done, _, _ = env.step(action)
+                elapsed += time.perf_counter_ns() - t
+                if done:
+                    env.reset()
+            return elapsed
+        return run
+    return factory
+
+
+def bench_get_state(aug):
+    def factory():
+        env = BriscolaEnv(aug=aug, seed=0)
+        env.reset()
+        for _ in range(5):
+            env.step(0)
+
+        def run(n):
+            t = time.perf_counter_ns()
+            for _ in range(n):
+                env._get_state()
+            return time.perf_counter_ns() - t
+        return run
+    return factory
+
+
+for _aug, _suffix in ((False, "plain"), (True, "aug")):
+    benchmark(f"env_reset_{_suffix}")(bench_env_reset(_aug))
+    benchmark(f"env_step_{_suffix}")(bench_env_step(_aug))
+    benchmark(f"env_get_state_{_suffix}")(bench_get_state(_aug))
+
+
+# Positions sampled from random games, both leading and responding
+def opponent_positions(count=1024):
+    rng = random.Random(0)
+    deck_rng = np.random.default_rng(0)
+    positions = []
+    while len(positions) < count:
+        deck = Deck()
+        deck.shuffle(deck_rng)
+        hand = [deck.draw() for _ in range(rng.randint(1, 3))]
+        table_card = deck.draw() if rng.random() < 0.5 else None
+        positions.append((hand, table_card, rng.choice(deck.cards).suit))
+    return positions
+
+
+def bench_opponent(opponent_cls):
+    def factory():
+        opponent = opponent_cls()
+        positions = opponent_positions()
+
+        def run(n):
+            t = time.perf_counter_ns()
+            for i in range(n):
+                opponent.play(*positions[i % len(positions)])
+            return time.perf_counter_ns() - t
+        return run
+    return factory
+
+
+for _name, _cls in (
+    ("random", RandomOpponent),
+    ("rule_based", RuleBasedOpponent),
+    ("rule_based_v2", RuleBasedOpponentV2),
+    ("rule_based_v3", RuleBasedOpponentV3),
+):
+    benchmark(f"opponent_play_{_name}")(bench_opponent(_cls))
+
+
+def random_transition(rng, state_dim=26):
+    return (
+        rng.random(state_dim, dtype=np.float32),
+        int(rng.integers(3)),
+        float(rng.normal()),
+        rng.random(state_dim, dtype=np.float32),
+        bool(rng.random() < 0.05),
+    )
+
+
+@benchmark("replay_buffer_add")
+def bench_buffer_add():
+    rng = np.random.default_rng(0)
+    buffer = ReplayBuffer(100_000)
+    transition = random_transition(rng)
+
+    def run(n):
+        t = time.perf_counter_ns()
+        for _ in range(n):
+            buffer.add(*transition)
+        return time.perf_counter_ns() - t
+    return run
+
+
+@benchmark("replay_buffer_sample_64")
+def bench_buffer_sample():
+    rng = np.random.default_rng(0)
+    buffer = ReplayBuffer(100_000)
+    for _ in range(100_000):
+        buffer.add(*random_transition(rng))
+
+    def run(n):
+        t = time.perf_counter_ns()
+        for _ in range(n):
+            buffer.sample(64)
+        return time.perf_counter_ns() - t
+    return run
+
+
+@benchmark("trainer_train_step")
+def bench_train_step():
+    rng = np.random.default_rng(0)
+    trainer = DQNTrainer(BriscolaEnv(seed=0))
+    for _ in range(10_000):
+        trainer.buffer.add(*random_transition(rng))
+
+    def run(n):
+        t = time.perf_counter_ns()
+        for _ in range(n):
+            trainer.train_step()
+        return time.perf_counter_ns() - t
+    return run
+
+
+def bench_forward(batch_size):
+    def factory():
+        model = DQN(26, 3).eval()
+        x = torch.rand(batch_size, 26)
+
+        def run(n):
+            with torch.no_grad():
+                t = time.perf_counter_ns()
+                for _ in range(n):
+                    model(x)
+                return time.perf_counter_ns() - t
+        return run
+    return factory
+
+
+for _batch_size in (1, 64, 256):
+    benchmark(f"dqn_forward_batch_{_batch_size}")(bench_forward(_batch_size))
+
+
+# Calibrate n so that a round lasts about min_time, then keep the median of
+# the per-op times over the rounds
+def measure(factory, rounds, min_time):
+    run = factory()
+    n = 1
+    while run(n) < min_time * 1e9 and n < 1 << 24:
+        n *= 2
+    return statistics.median(run(n) / n for _ in range(rounds)) / 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filter", default="", help="run only benchmarks containing this string")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.05, help="seconds per round")
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--save", default=None, help="write the results to this JSON file")
+    parser.add_argument("--compare", default=None, help="baseline JSON file to compare with")
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    random.seed(0)
+    torch.manual_seed(0)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    print(f"{'benchmark':<32} {'us/op':>12} {'baseline':>12} {'delta':>9}")
+    for name, factory in BENCHMARKS.items():
+        if args.filter not in name:
+            continue
+        results[name] = measure(factory, args.rounds, args.min_time)
+        line = f"{name:<32} {results[name]:>12.3f}"
+        if name in baseline:
+            delta = (results[name] - baseline[name]) / baseline[name] * 100.0
+            line += f" {baseline[name]:>12.3f} {delta:>+8.1f}%"
+        print(line)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(
+                {
+                    "meta": {
+                        "python": platform.python_version(),
+                        "numpy": np.__version__,
+                        "torch": torch.__version__,
+                        "machine": platform.machine(),
+                        "threads": args.threads,
+                    },
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
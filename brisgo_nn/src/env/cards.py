@@ -44,11 +44,16 @@ class Card:
         self.suit = suit
         self.points = CARD_POINTS[name]
         self.name_id = CARD_NAMES.index(name)
+        # Position of the card in an unshuffled deck (0-39)
+        self.id = SUITS.index(suit) * len(CARD_NAMES) + self.name_id
 
     def __repr__(self):
         
         return f"{self.name.capitalize()} of {self.suit.capitalize()}"
 
+def card_from_id(card_id: int) -> Card:
+    return Card(CARD_NAMES[card_id % len(CARD_NAMES)], SUITS[card_id // len(CARD_NAMES)])
+
 class Deck:
 
     def __init__(self):
@@ -58,8 +63,12 @@ class Deck:
             for name in CARD_NAMES
         ]
 
-    def shuffle(self):
-        random.shuffle(self.cards)
+    # Shuffle with a numpy Generator when given, with the global random otherwise
+    def shuffle(self, rng=None):
+        if rng is None:
+            random.shuffle(self.cards)
+        else:
+            self.cards = [self.cards[i] for i in rng.permutation(len(self.cards))]
 
     def draw(self) -> Card:
         assert len(self.cards) > 0, "Deck is empty"
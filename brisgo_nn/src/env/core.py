@@ -0,0 +1,298 @@
+import numpy as np
+import os
+import sys
+
+CURRENT_DIR = os.path.dirname(__file__)
+PARENT_DIR = os.path.dirname(CURRENT_DIR)
+if PARENT_DIR not in sys.path:
+    sys.path.insert(0, PARENT_DIR)
+
+from env.cards import CARD_NAMES, Deck, Card, card_from_id, compare_cards
+from agents.opponent import RandomOpponent
+
+# Suit order of the one hot encoding and of the deck_seen columns
+ENCODED_SUITS = ["batons", "cups", "coins", "swords"]
+SEEN_SUITS = ["coins", "batons", "swords", "cups"]
+
+# One hot enconding for the suit and rank encoding of the card
+def encode_card(card: Card, briscola_suit: str):
+    name_norm = card.name_id / 9.0
+    is_briscola = 1.0 if card.suit == briscola_suit else 0.0
+    suit_oh = [1.0 if card.suit == s else 0.0 for s in ENCODED_SUITS]
+    return [name_norm, is_briscola] + suit_oh
+
+# Agent observation: 26 values, plus the 40 deck_seen flags for aug models.
+# Shared by the game and the inference service, which encodes card ids sent
+# by the clients
+def encode_state(step_count, agent_points, hand, table_card, briscola_suit, deck_seen=None):
+
+    state = []
+    state.append(step_count / 20.0)
+    state.append(agent_points / 120.0)
+
+    for i in range(3):
+        if i < len(hand):
+            state.extend(encode_card(hand[i], briscola_suit))
+        else:
+            state.extend([0.0] * 6)
+
+    if table_card is not None:
+        state.extend(encode_card(table_card, briscola_suit))
+    else:
+        state.extend([0.0] * 6)
+
+    if deck_seen is not None:
+        state.extend(deck_seen.flatten().tolist())
+
+    expected_len = 26 + (40 if deck_seen is not None else 0)
+    assert len(state) == expected_len, (
+        f"State length is {len(state)}, expected {expected_len}"
+    )
+
+    return np.array(state, dtype=np.float32)
+
+# deck_seen matrix (rank x SEEN_SUITS) of a collection of card ids
+def deck_seen_from_ids(card_ids):
+    deck_seen = np.zeros((10, 4), dtype=np.float32)
+    for card_id in card_ids:
+        card = card_from_id(card_id)
+        deck_seen[card.name_id, SEEN_SUITS.index(card.suit)] = 1.0
+    return deck_seen
+
+# Game rules and state encoding without any gymnasium dependency, so that
+# workers and the inference service can import them cheaply. Randomness
+# (shuffle, first leader, default opponent) comes from a per-instance
+# numpy Generator; env.env.BriscolaEnv wraps this class for gymnasium.
+# Without a seed the Generator is seeded from numpy's global state, so code
+# that calls np.random.seed() (train, sweep) still replays the same games.
+class BriscolaGame:
+
+    num_actions = 3
+
+    def __init__(self, opponent=None, aug=False, recorder=None, seed=None):
+
+        self.aug = aug
+        self.state_size = 26 + (40 if self.aug else 0)
+        if seed is None:
+            seed = int(np.random.randint(2**31))
+        self.rng = np.random.default_rng(seed)
+
+        # Who starts the trick
+        self.leader = ""  
+
+        self.opponent = opponent if opponent is not None else RandomOpponent(rng=self.rng)
+
+        self.deck = None
+        self.briscola_suit = None
+
+        self.agent_hand = []
+        self.opponent_hand = []
+        self.table_card = None
+
+        self.agent_points = 0
+        self.opponent_points = 0
+        self.step_count = 0
+        self.deck_seen = None
+
+        # Optional GameRecorder (see env/records.py) notified of every move
+        self.recorder = recorder
+    
+    # Choosing of the opponent
+    def change_opponent(self, opponent):
+
+        self.opponent = opponent if opponent is not None else RandomOpponent(rng=self.rng)
+    
+    # Start a new game. options can force the "deck" order (card ids) and the
+    # "leader", which is how recorded games are replayed
+    def reset(self, seed=None, options=None):
+        # Reseed in place: the default opponent shares this generator
+        if seed is not None:
+            self.rng.bit_generator.state = np.random.default_rng(seed).bit_generator.state
+        options = options or {}
+
+        self.deck = Deck()
+        if options.get("deck") is not None:
+            self.deck.cards = [card_from_id(int(card_id)) for card_id in options["deck"]]
+        else:
+            self.deck.shuffle(self.rng)
+        deck_ids = [card.id for card in self.deck.cards]
+
+        # Draw briscola
+        briscola_card = self.deck.draw()
+        self.briscola_suit = briscola_card.suit
+        self.deck.put_back(briscola_card)
+
+        # Deal cards
+        self.agent_hand = [self.deck.draw() for _ in range(3)]
+        self.opponent_hand = [self.deck.draw() for _ in range(3)]
+
+        # Initialize the match
+        self.agent_points = 0
+        self.opponent_points = 0
+        self.step_count = 0
+        self._init_deck_seen()
+        self._mark_seen(briscola_card)
+        for card in self.agent_hand:
+            self._mark_seen(card)
+
+        # Decide who starts the first hand
+        if options.get("leader") is not None:
+            self.leader = options["leader"]
+        else:
+            self.leader = "agent" if self.rng.random() < 0.5 else "opponent"
+        self.table_card = None
+
+        if self.recorder is not None:
+            self.recorder.start(deck_ids, self.leader)
+
+        # If opponent starts, he plays immediately
+        if self.leader == "opponent":
+            opp_idx = self.opponent.play(
+                self.opponent_hand,
+                table_card=None,
+                briscola_suit=self.briscola_suit
+            )
+            self._record_move(opp_idx)
+            self.table_card = self.opponent_hand.pop(opp_idx)
+            self._mark_seen(self.table_card)
+
+        return self._get_state(), {}
+    
+    # Play the agent card and solve the trick (performs the action)
+    def step(self, action: int):
+        reward = 0.0
+        terminated = False
+        truncated = False
+
+        if action >= len(self.agent_hand):
+            return self._get_state(), -10.0, False, False, {}
+
+        # Action choosen by the network
+        self._record_move(action)
+        agent_card = self.agent_hand.pop(action)
+        self._mark_seen(agent_card)
+
+        # Trick solving
+        if self.table_card is not None:
+
+            # Opponent opened, agent responds
+            first_card = self.table_card
+            second_card = agent_card
+            first_player = "opponent"
+
+        else:
+
+            # Agent opens, opponent responds
+            first_card = agent_card
+            opp_idx = self.opponent.play(
+                self.opponent_hand,
+                table_card=agent_card,
+                briscola_suit=self.briscola_suit
+            )
+            self._record_move(opp_idx)
+            second_card = self.opponent_hand.pop(opp_idx)
+            first_player = "agent"
+            self._mark_seen(second_card)
+
+        # Decide winner
+        winner_first = (compare_cards(first_card, second_card, self.briscola_suit) == 0)
+        if winner_first:
+            winner = first_player
+        else:
+            winner = "agent" if first_player == "opponent" else "opponent"
+
+        # Assign points
+        hand_points = first_card.points + second_card.points
+
+        if winner == "agent":
+            self.agent_points += hand_points
+            reward += hand_points
+        else:
+            self.opponent_points += hand_points
+            reward -= hand_points
+
+        # Clear table and set leader
+        self.table_card = None
+        self.leader = winner
+
+        # Draw cards (winner first)
+        if len(self.deck) > 0:
+            if winner == "agent":
+                self.agent_hand.append(self.deck.draw())
+                self._mark_seen(self.agent_hand[-1])
+                self.opponent_hand.append(self.deck.draw())
+            else:
+                self.opponent_hand.append(self.deck.draw())
+                self.agent_hand.append(self.deck.draw())
+                self._mark_seen(self.agent_hand[-1])
+
+        self.step_count += 1
+
+        # Terminal condition
+        if (
+            len(self.deck) == 0
+            and len(self.agent_hand) == 0
+            and len(self.opponent_hand) == 0
+        ):
+            terminated = True
+            if self.agent_points > self.opponent_points:
+                reward += 100.0
+            else:
+                reward -= 100.0
+            if self.recorder is not None:
+                self.recorder.end()
+            return self._get_state(), reward, terminated, truncated, {}
+
+        # Opponent opens next hand
+        if self.leader == "opponent" and len(self.opponent_hand) > 0:
+            opp_idx = self.opponent.play(
+                self.opponent_hand,
+                table_card=None,
+                briscola_suit=self.briscola_suit
+            )
+            self._record_move(opp_idx)
+            self.table_card = self.opponent_hand.pop(opp_idx)
+            self._mark_seen(self.table_card)
+
+        return self._get_state(), reward, terminated, truncated, {}
+
+    # Obtain the state normalizing each values from 0 to 1
+    def _get_state(self):
+        return encode_state(
+            self.step_count,
+            self.agent_points,
+            self.agent_hand,
+            self.table_card,
+            self.briscola_suit,
+            self.deck_seen if self.aug else None,
+        )
+
+    def _record_move(self, idx: int):
+        if self.recorder is not None:
+            self.recorder.move(idx)
+
+    def _init_deck_seen(self):
+        if not self.aug:
+            return
+        self.deck_seen = np.zeros((10, 4), dtype=np.float32)
+
+    def _mark_seen(self, card: Card):
+        if not self.aug or card is None:
+            return
+        rank_idx = self._rank_index(card.name)
+        suit_idx = self._suit_index(card.suit)
+        self.deck_seen[rank_idx, suit_idx] = 1.0
+
+    def _rank_index(self, name: str) -> int:
+        return CARD_NAMES.index(name)
+
+    def _suit_index(self, suit: str) -> int:
+        return SEEN_SUITS.index(suit)
+    
+    # Render mode for local playing to perform test
+    def render(self):
+        print(f"Briscola: {self.briscola_suit}")
+        print(f"Agent hand: {self.agent_hand}")
+        print(f"Opponent hand: {len(self.opponent_hand)} cards")
+        print(f"Points: agent={self.agent_points}, opp={self.opponent_points}")
+    
@@ -0,0 +1,144 @@
+import argparse
+import os
+import struct
+import sys
+
+import numpy as np
+
+CURRENT_DIR = os.path.dirname(__file__)
+PARENT_DIR = os.path.dirname(CURRENT_DIR)
+if PARENT_DIR not in sys.path:
+    sys.path.insert(0, PARENT_DIR)
+
+from agents.opponent import Opponent
+from env.core import BriscolaGame
+
+# A game is the deck order (card ids in draw order, the briscola is the last
+# one), who leads the first trick and the 40 hand indices in the order the
+# cards were played, by either player. 81 bytes per game.
+RECORD_DTYPE = np.dtype([
+    ("deck", np.uint8, (40,)),
+    ("leader", np.uint8),
+    ("moves", np.uint8, (40,)),
+])
+
+# File header: magic, format version, record size
+MAGIC = b"BRGR"
+VERSION = 1
+HEADER = struct.Struct("<4sII")
+
+LEADERS = ["agent", "opponent"]
+
+
+# Appends every game played by a BriscolaGame(recorder=...) to a record file
+class GameRecorder:
+
+    def __init__(self, path: str):
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "ab")
+        if new_file:
+            self.file.write(HEADER.pack(MAGIC, VERSION, RECORD_DTYPE.itemsize))
+        self.record = np.zeros((), dtype=RECORD_DTYPE)
+        self.num_moves = 0
+
+    def start(self, deck_ids, leader: str):
+        self.record["deck"] = deck_ids
+        self.record["leader"] = LEADERS.index(leader)
+        self.num_moves = 0
+
+    def move(self, idx: int):
+        self.record["moves"][self.num_moves] = idx
+        self.num_moves += 1
+
+    def end(self):
+        assert self.num_moves == 40, f"Recorded {self.num_moves} moves, expected 40"
+        self.file.write(self.record.tobytes())
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Memory map of all the records of a file (no copy, no parsing)
+def load_records(path: str) -> np.ndarray:
+    with open(path, "rb") as f:
+        magic, version, record_size = HEADER.unpack(f.read(HEADER.size))
+    assert magic == MAGIC, f"{path} is not a game record file"
+    assert version == VERSION, f"Unsupported record version {version}"
+    assert record_size == RECORD_DTYPE.itemsize, f"Unexpected record size {record_size}"
+    if os.path.getsize(path) == HEADER.size:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER.size)
+
+
+# Plays back the recorded opponent moves, the replayer consumes the agent ones
+class ScriptedOpponent(Opponent):
+
+    def __init__(self, moves):
+        self.moves = moves
+        self.pos = 0
+
+    def next_move(self) -> int:
+        move = int(self.moves[self.pos])
+        self.pos += 1
+        return move
+
+    def play(self, hand, table_card, briscola_suit) -> int:
+        return self.next_move()
+
+
+# Rebuild the agent transitions (state, action, reward, next_state, done) of a
+# recorded game with any observation encoding
+def replay(record, aug=False):
+    script = ScriptedOpponent(record["moves"])
+    env = BriscolaGame(opponent=script, aug=aug)
+    state, _ = env.reset(options={
+        "deck": record["deck"],
+        "leader": LEADERS[int(record["leader"])],
+    })
+
+    done = False
+    while not done:
+        action = script.next_move()
+        next_state, reward, terminated, truncated, _ = env.step(action)
+        done = terminated or truncated
+        yield state, action, reward, next_state, done
+        state = next_state
+
+
+# Final points of a recorded game
+def final_points(record):
+    script = ScriptedOpponent(record["moves"])
+    env = BriscolaGame(opponent=script)
+    env.reset(options={"deck": record["deck"], "leader": LEADERS[int(record["leader"])]})
+    while script.pos < len(record["moves"]):
+        env.step(script.next_move())
+    return env.agent_points, env.opponent_points
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path")
+    args = parser.parse_args()
+
+    records = load_records(args.path)
+    results = {"win": 0, "loss": 0, "draw": 0}
+    for record in records:
+        agent_points, opponent_points = final_points(record)
+        if agent_points > opponent_points:
+            results["win"] += 1
+        elif agent_points < opponent_points:
+            results["loss"] += 1
+        else:
+            results["draw"] += 1
+
+    print(f"{len(records)} games: {results}")
+
+
+if __name__ == "__main__":
+    main()
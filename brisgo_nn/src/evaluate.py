@@ -25,8 +25,8 @@ def select_action(model, state, env, device):
     return int(torch.argmax(masked_q).item())
 
 
-def play_episode(model, opponent, device, aug=False):
-    env = BriscolaEnv(opponent=opponent, aug=aug)
+def play_episode(model, opponent, device, aug=False, recorder=None):
+    env = BriscolaEnv(opponent=opponent, aug=aug, recorder=recorder)
     state, _ = env.reset()
     done = False
 
@@ -42,10 +42,10 @@ def play_episode(model, opponent, device, aug=False):
     return "draw"
 
 
-def evaluate(model, opponent, episodes, device, aug=False):
+def evaluate(model, opponent, episodes, device, aug=False, recorder=None):
     results = {"win": 0, "loss": 0, "draw": 0}
     for _ in range(episodes):
-        outcome = play_episode(model, opponent, device, aug=aug)
+        outcome = play_episode(model, opponent, device, aug=aug, recorder=recorder)
         results[outcome] += 1
     return results
 
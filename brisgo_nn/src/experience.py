@@ -0,0 +1,109 @@
+import glob
+import json
+import os
+
+import numpy as np
+
+
+# Fixed schema of a shard: one .npy file per field, rows aligned by index
+def shard_fields(state_dim: int):
+    return {
+        "states": (np.float32, (state_dim,)),
+        "actions": (np.int64, ()),
+        "rewards": (np.float32, ()),
+        "next_states": (np.float32, (state_dim,)),
+        "dones": (np.float32, ()),
+    }
+
+
+# Streams transitions into fixed-size shards. Each writer owns a prefix and
+# its own <prefix>.manifest.json, so several actors can share a directory
+class ShardWriter:
+
+    def __init__(self, out_dir: str, state_dim: int, prefix: str = "actor0", shard_size: int = 100_000):
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.fields = shard_fields(state_dim)
+        self.manifest = {"state_dim": state_dim, "shards": []}
+        self._alloc()
+
+    def _alloc(self):
+        self.data = {
+            name: np.zeros((self.shard_size, *shape), dtype=dtype)
+            for name, (dtype, shape) in self.fields.items()
+        }
+        self.size = 0
+
+    def add(self, state, action, reward, next_state, done):
+        i = self.size
+        self.data["states"][i] = state
+        self.data["actions"][i] = action
+        self.data["rewards"][i] = reward
+        self.data["next_states"][i] = next_state
+        self.data["dones"][i] = done
+        self.size += 1
+        if self.size == self.shard_size:
+            self.flush()
+
+    def flush(self):
+        if self.size == 0:
+            return
+        name = f"{self.prefix}_{len(self.manifest['shards']):05d}"
+        for field, arr in self.data.items():
+            np.save(os.path.join(self.out_dir, f"{name}_{field}.npy"), arr[:self.size])
+        self.manifest["shards"].append({"name": name, "size": self.size})
+
+        # Write-then-rename so readers never see a half written manifest
+        path = os.path.join(self.out_dir, f"{self.prefix}.manifest.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(path + ".tmp", path)
+        self._alloc()
+
+    def close(self):
+        self.flush()
+
+
+# Samples uniformly across all the shards of a directory. Shards are memory
+# mapped, so only the sampled rows are paged in
+class ShardReader:
+
+    def __init__(self, data_dir: str, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.shards = []
+        self.state_dim = None
+
+        for manifest_path in sorted(glob.glob(os.path.join(data_dir, "*.manifest.json"))):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            if self.state_dim is None:
+                self.state_dim = manifest["state_dim"]
+            assert manifest["state_dim"] == self.state_dim, (
+                f"{manifest_path} has state_dim {manifest['state_dim']}, expected {self.state_dim}"
+            )
+            for shard in manifest["shards"]:
+                self.shards.append({
+                    field: np.load(os.path.join(data_dir, f"{shard['name']}_{field}.npy"), mmap_mode="r")
+                    for field in shard_fields(self.state_dim)
+                })
+
+        assert self.shards, f"No shards found in {data_dir}"
+        sizes = [len(shard["actions"]) for shard in self.shards]
+        self.offsets = np.concatenate([[0], np.cumsum(sizes)])
+
+    def sample(self, batch_size: int):
+        idx = np.sort(self.rng.integers(0, len(self), size=batch_size))
+        shard_ids = np.searchsorted(self.offsets, idx, side="right") - 1
+
+        batch = {field: [] for field in shard_fields(self.state_dim)}
+        for shard_id in np.unique(shard_ids):
+            rows = idx[shard_ids == shard_id] - self.offsets[shard_id]
+            for field, arr in self.shards[shard_id].items():
+                batch[field].append(arr[rows])
+
+        return tuple(np.concatenate(batch[field]) for field in batch)
+
+    def __len__(self):
+        return int(self.offsets[-1])
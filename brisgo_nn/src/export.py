@@ -0,0 +1,61 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+import torch
+
+from model import DQN
+
+CURRENT_DIR = os.path.dirname(__file__)
+SERVICE_DIR = os.path.dirname(CURRENT_DIR)
+if SERVICE_DIR not in sys.path:
+    sys.path.insert(0, SERVICE_DIR)
+
+from numpy_backend import NumpyDQN
+
+
+# Linear layers of a DQN state dict in order, as (weight, bias) arrays
+def linear_layers(state_dict):
+    indices = sorted({int(key.split(".")[1]) for key in state_dict if key.endswith(".weight")})
+    return [
+        (state_dict[f"net.{i}.weight"].float().numpy(), state_dict[f"net.{i}.bias"].float().numpy())
+        for i in indices
+    ]
+
+
+def export_npz(state_dict, out_path, dtype=np.float32):
+    arrays = {}
+    for i, (w, b) in enumerate(linear_layers(state_dict)):
+        arrays[f"w{i}"] = w.astype(dtype)
+        arrays[f"b{i}"] = b.astype(dtype)
+    np.savez(out_path, **arrays)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("weights", help=".pth state dict of a DQN")
+    parser.add_argument("--out", default=None, help="defaults to the weights path with .npz")
+    parser.add_argument("--check", type=int, default=10000, help="random states used to compare actions")
+    args = parser.parse_args()
+
+    out_path = args.out or os.path.splitext(args.weights)[0] + ".npz"
+    state_dict = torch.load(args.weights, map_location="cpu")
+    export_npz(state_dict, out_path)
+
+    layers = linear_layers(state_dict)
+    state_dim, num_nodes, num_actions = layers[0][0].shape[1], layers[0][0].shape[0], layers[-1][0].shape[0]
+    model = DQN(state_dim, num_actions, num_nodes=num_nodes)
+    model.load_state_dict(state_dict)
+    model.eval()
+
+    states = np.random.default_rng(0).random((args.check, state_dim), dtype=np.float32)
+    with torch.no_grad():
+        expected = model(torch.from_numpy(states)).argmax(dim=1).numpy()
+    actual = NumpyDQN(*zip(*layers))(states).argmax(axis=1)
+    agreement = (expected == actual).mean() * 100.0
+    print(f"{out_path}: state_dim={state_dim} nodes={num_nodes} action agreement {agreement:.2f}%")
+
+
+if __name__ == "__main__":
+    main()
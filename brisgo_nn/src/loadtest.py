@@ -0,0 +1,251 @@
+import argparse
+import http.client
+import json
+import queue
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import numpy as np
+
+from env.cards import SUITS
+from env.core import SEEN_SUITS
+from env.env import BriscolaEnv
+from agents.rule_based_agent_v3 import RuleBasedOpponentV3
+
+# Load generator for the inference service (brisgo_nn/app.py). Requests
+# replay the positions of BriscolaEnv games against the rule-based opponent,
+# encoded for the model each difficulty serves (read from /health).
+#   closed loop: --concurrency clients, each sends its next request as soon
+#                as the previous one is answered
+#   open loop:   requests start at --rate per second (Poisson arrivals)
+#                whatever the answers; latency counts from the scheduled
+#                start, so a saturated server shows up as latency
+
+
+# One position seen by the agent: the aug state (its first 26 values are the
+# plain state) and the card-id view of /act/cards
+def game_positions(games, seed):
+    env = BriscolaEnv(opponent=RuleBasedOpponentV3(), aug=True, seed=seed)
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(games):
+        state, _ = env.reset()
+        done = False
+        while not done:
+            seen = 0
+            for rank, column in zip(*np.nonzero(env.deck_seen)):
+                seen |= 1 << (SUITS.index(SEEN_SUITS[column]) * 10 + int(rank))
+            cards = {
+                "hand": [card.id for card in env.agent_hand],
+                "table": None if env.table_card is None else env.table_card.id,
+                "briscola": env.briscola_suit,
+                "step": env.step_count,
+                "points": env.agent_points,
+                "seen": seen,
+            }
+            positions.append((state.tolist(), cards))
+            state, _, done, _, _ = env.step(rng.randrange(len(env.agent_hand)))
+    return positions
+
+
+def wait_ready(url, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=10)
+        try:
+            conn.request("GET", "/health")
+            response = conn.getresponse()
+            body = json.loads(response.read())
+            if response.status == 200:
+                return body
+        except (OSError, ValueError):
+            pass
+        finally:
+            conn.close()
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"{url.geturl()} not ready after {timeout}s")
+        time.sleep(0.5)
+
+
+# Endless stream of (path, serialized JSON body) requests for the chosen endpoint
+def request_stream(positions, endpoint, difficulties, encodings, batch_size, seed):
+    rng = random.Random(seed)
+    dims = {"plain": 26, "aug": 66}
+    while True:
+        difficulty = rng.choice(difficulties)
+        if endpoint == "batch":
+            entries = []
+            for _ in range(batch_size):
+                state, _ = rng.choice(positions)
+                entries.append({"difficulty": difficulty, "state": state[:dims[encodings[difficulty]]]})
+            yield "/act/batch", json.dumps({"entries": entries})
+        elif endpoint == "cards":
+            yield "/act/cards", json.dumps({"difficulty": difficulty, "cards": rng.choice(positions)[1]})
+        else:
+            state, _ = rng.choice(positions)
+            yield "/act", json.dumps({"difficulty": difficulty, "state": state[:dims[encodings[difficulty]]]})
+
+
+class Client:
+
+    def __init__(self, url, timeout):
+        # One persistent connection per client (re-opened if the server closes it)
+        self.conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=timeout)
+
+    def send(self, path, body):
+        try:
+            self.conn.request("POST", path, body, {"Content-Type": "application/json"})
+            response = self.conn.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            return "error"
+
+
+# Shared results: (start time, latency, status) of every finished request
+class Results:
+
+    def __init__(self):
+        self.samples = []
+        self.lock = threading.Lock()
+
+    def add(self, start, latency, status):
+        with self.lock:
+            self.samples.append((start, latency, status))
+
+
+def closed_loop(url, bodies, args, results, deadline):
+    def client_loop(seed):
+        client = Client(url, args.timeout)
+        stream = request_stream(*bodies, seed=seed)
+        while time.perf_counter() < deadline:
+            path, body = next(stream)
+            start = time.perf_counter()
+            status = client.send(path, body)
+            results.add(start, time.perf_counter() - start, status)
+
+    threads = [threading.Thread(target=client_loop, args=(args.seed + i,)) for i in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def open_loop(url, bodies, args, results, deadline):
+    scheduled = queue.Queue()
+
+    def client_loop():
+        client = Client(url, args.timeout)
+        while True:
+            item = scheduled.get()
+            if item is None:
+                return
+            start, path, body = item
+            # Wait for the scheduled start if the client is early
+            delay = start - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            status = client.send(path, body)
+            results.add(start, time.perf_counter() - start, status)
+
+    threads = [threading.Thread(target=client_loop) for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+
+    rng = random.Random(args.seed)
+    stream = request_stream(*bodies, seed=args.seed)
+    start = time.perf_counter()
+    while start < deadline:
+        path, body = next(stream)
+        scheduled.put((start, path, body))
+        start += rng.expovariate(args.rate)
+        delay = start - time.perf_counter() - 0.01
+        if delay > 0:
+            time.sleep(delay)
+    for _ in threads:
+        scheduled.put(None)
+    for thread in threads:
+        thread.join()
+
+
+def report(samples, duration, args):
+    latencies = np.array([latency for _, latency, _ in samples]) * 1000.0
+    statuses = {}
+    for _, _, status in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    ok = statuses.get("200", 0)
+    states_per_request = args.batch_size if args.endpoint == "batch" else 1
+    result = {
+        "config": {
+            "url": args.url,
+            "mode": args.mode,
+            "endpoint": args.endpoint,
+            "difficulties": args.difficulties,
+            "concurrency": args.concurrency,
+            "rate": args.rate if args.mode == "open" else None,
+            "batch_size": states_per_request,
+            "duration_s": args.duration,
+        },
+        "requests": len(samples),
+        "status_codes": statuses,
+        "error_rate": 1.0 - ok / len(samples) if samples else 0.0,
+        "throughput_rps": ok / duration,
+        "states_per_s": ok * states_per_request / duration,
+    }
+    if len(latencies):
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        result["latency_ms"] = {
+            "mean": float(latencies.mean()),
+            "p50": float(p50),
+            "p95": float(p95),
+            "p99": float(p99),
+            "max": float(latencies.max()),
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    parser.add_argument("--endpoint", choices=["act", "cards", "batch"], default="act")
+    parser.add_argument("--difficulties", default="medium,hard")
+    parser.add_argument("--concurrency", type=int, default=8, help="clients (open loop: max in flight)")
+    parser.add_argument("--rate", type=float, default=200.0, help="open loop requests per second")
+    parser.add_argument("--batch-size", type=int, default=32, help="states per /act/batch request")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds before measuring")
+    parser.add_argument("--games", type=int, default=200, help="games played to collect states")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    url = urlparse(args.url)
+    args.difficulties = args.difficulties.split(",")
+    health = wait_ready(url, timeout=120)
+    encodings = {d: health["models"][d]["encoding"] for d in args.difficulties}
+
+    positions = game_positions(args.games, args.seed)
+    print(f"{len(positions)} positions from {args.games} games, encodings {encodings}")
+    bodies = (positions, args.endpoint, args.difficulties, encodings, args.batch_size)
+
+    run = closed_loop if args.mode == "closed" else open_loop
+    results = Results()
+    begin = time.perf_counter()
+    measured_from = begin + args.warmup
+    run(url, bodies, args, results, measured_from + args.duration)
+
+    samples = [s for s in results.samples if s[0] >= measured_from]
+    result = report(samples, args.duration, args)
+    print(json.dumps(result, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,5 @@
+import numpy as np
+import torch
 import torch.nn as nn
 from collections import deque
 import random
@@ -28,6 +30,31 @@ class ReplayBuffer:
 
     def __len__(self):
         return len(self.buffer)
+
+    # Transitions as stacked tensors, for checkpoints (torch.load with
+    # weights_only accepts them, unlike pickled numpy rows)
+    def state_dict(self):
+        if not self.buffer:
+            return {}
+        states, actions, rewards, next_states, dones = zip(*self.buffer)
+        return {
+            "states": torch.as_tensor(np.array(states, dtype=np.float32)),
+            "actions": torch.as_tensor(np.array(actions, dtype=np.int64)),
+            "rewards": torch.as_tensor(np.array(rewards, dtype=np.float32)),
+            "next_states": torch.as_tensor(np.array(next_states, dtype=np.float32)),
+            "dones": torch.as_tensor(np.array(dones, dtype=np.bool_)),
+        }
+
+    def load_state_dict(self, state):
+        if not state:
+            return
+        self.buffer.extend(zip(
+            state["states"].numpy(),
+            state["actions"].tolist(),
+            state["rewards"].tolist(),
+            state["next_states"].numpy(),
+            state["dones"].tolist(),
+        ))
     
 
     
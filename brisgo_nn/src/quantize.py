@@ -0,0 +1,128 @@
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+
+from model import DQN
+from export import export_npz, linear_layers
+from env.core import BriscolaGame
+from env.records import load_records, replay
+from agents.rule_based_agent_v1 import RuleBasedOpponent
+from agents.rule_based_agent_v2 import RuleBasedOpponentV2
+from agents.rule_based_agent_v3 import RuleBasedOpponentV3
+
+CURRENT_DIR = os.path.dirname(__file__)
+SERVICE_DIR = os.path.dirname(CURRENT_DIR)
+if SERVICE_DIR not in sys.path:
+    sys.path.insert(0, SERVICE_DIR)
+
+import numpy_backend
+import torch_backend
+
+
+# States the agent actually meets: replayed from game records when given,
+# otherwise collected by letting the float32 model play the rule-based agents
+def evaluation_states(model, state_dim, records_path=None, games=2000):
+    aug = state_dim > 26
+    states = []
+    if records_path:
+        for record in load_records(records_path):
+            states.extend(state for state, *_ in replay(record, aug=aug))
+        return np.array(states, dtype=np.float32)
+
+    opponents = [RuleBasedOpponent(), RuleBasedOpponentV2(), RuleBasedOpponentV3()]
+    game = BriscolaGame(aug=aug, seed=0)
+    for i in range(games):
+        game.change_opponent(opponents[i % len(opponents)])
+        state, _ = game.reset()
+        done = False
+        while not done:
+            states.append(state)
+            with torch.no_grad():
+                q_values = model(torch.from_numpy(state).unsqueeze(0)).squeeze(0)
+            q_values[len(game.agent_hand):] = -1e9
+            state, _, done, _, _ = game.step(int(q_values.argmax()))
+    return np.array(states, dtype=np.float32)
+
+
+def batch1_latency_us(model, states, repeat=2000):
+    rows = [states[i:i + 1] for i in range(min(repeat, len(states)))]
+    start = time.perf_counter()
+    for row in rows:
+        model(row)
+    return (time.perf_counter() - start) / len(rows) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("weights", help=".pth state dict of a DQN")
+    parser.add_argument("--records", default=None, help="game record file to take the states from")
+    parser.add_argument("--games", type=int, default=2000, help="games played when no records are given")
+    parser.add_argument("--min-agreement", type=float, default=99.0, help="percent needed to accept a variant")
+    args = parser.parse_args()
+
+    torch.set_num_threads(1)
+    base = os.path.splitext(args.weights)[0]
+    state_dict = torch.load(args.weights, map_location="cpu")
+    layers = linear_layers(state_dict)
+    state_dim, num_nodes, num_actions = layers[0][0].shape[1], layers[0][0].shape[0], layers[-1][0].shape[0]
+
+    model = DQN(state_dim, num_actions, num_nodes=num_nodes)
+    model.load_state_dict(state_dict)
+    model.eval()
+
+    # Variants in the files the service loads (see backend_file in app.py)
+    torch.save(torch_backend.quantize_int8(copy.deepcopy(model)).state_dict(), f"{base}.int8.pth")
+    torch.save({k: v.half() for k, v in state_dict.items()}, f"{base}.fp16.pth")
+    export_npz(state_dict, f"{base}.npz")
+    export_npz(state_dict, f"{base}.fp16.npz", dtype=np.float16)
+
+    states = evaluation_states(model, state_dim, args.records, args.games)
+    reference = torch_backend.load_model(args.weights, state_dim, num_actions, num_nodes=num_nodes)
+    expected = reference(states).argmax(axis=1)
+
+    variants = [
+        ("torch", "fp32", args.weights, torch_backend),
+        ("torch", "int8", f"{base}.int8.pth", torch_backend),
+        ("torch", "fp16", f"{base}.fp16.pth", torch_backend),
+        ("numpy", "fp32", f"{base}.npz", numpy_backend),
+        ("numpy", "fp16", f"{base}.fp16.npz", numpy_backend),
+    ]
+
+    report = {"weights": args.weights, "states": len(states), "variants": []}
+    print(f"{len(states)} evaluation states")
+    for backend_name, precision, path, backend in variants:
+        served = backend.load_model(path, state_dim, num_actions, precision=precision, num_nodes=num_nodes)
+        agreement = float((served(states).argmax(axis=1) == expected).mean() * 100.0)
+        latency = batch1_latency_us(served, states)
+        size_kb = os.path.getsize(path) / 1024.0
+        accepted = agreement >= args.min_agreement
+        report["variants"].append({
+            "backend": backend_name,
+            "precision": precision,
+            "path": path,
+            "agreement": agreement,
+            "batch1_us": latency,
+            "size_kb": size_kb,
+            "accepted": accepted,
+        })
+        print(
+            f"  {backend_name:<6} {precision:<5} agreement {agreement:6.2f}% | "
+            f"batch-1 {latency:7.1f} us | {size_kb:7.1f} KB | {path}"
+            + ("" if accepted else f"  (below {args.min_agreement}%)")
+        )
+
+    # Read by the service next to the weights (app.served_precision): a
+    # MODEL_PRECISION variant not accepted here is served as fp32. Upload it
+    # with the variants for the gcs weights backend
+    with open(f"{base}.quantization.json", "w") as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
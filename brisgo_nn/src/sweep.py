@@ -0,0 +1,152 @@
+import argparse
+import json
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+
+from train import DQNTrainer, make_env
+from evaluate import evaluate
+from agents.rule_based_agent_v1 import RuleBasedOpponent
+from agents.rule_based_agent_v2 import RuleBasedOpponentV2
+from agents.rule_based_agent_v3 import RuleBasedOpponentV3
+
+
+# Values sampled independently for every configuration of the sweep
+SEARCH_SPACE = {
+    "gamma": [0.9, 0.95, 0.99],
+    "lr": [1e-4, 3e-4, 1e-3, 3e-3],
+    "buffer_size": [50_000, 100_000, 200_000],
+    "batch_size": [32, 64, 128],
+    "eps_end": [0.01, 0.05, 0.1],
+    "eps_decay": [0.999, 0.9995, 0.9999],
+    "num_nodes": [64, 128],
+}
+
+SCENARIOS = [
+    ("rule_based", RuleBasedOpponent),
+    ("rule_based_v2", RuleBasedOpponentV2),
+    ("rule_based_v3", RuleBasedOpponentV3),
+]
+
+
+def sample_configs(num_configs, rng):
+    return [
+        {name: rng.choice(values) for name, values in SEARCH_SPACE.items()}
+        for _ in range(num_configs)
+    ]
+
+
+# Train a trial up to the rung budget (resuming from its checkpoint, replay
+# buffer included, so a rung continues the previous one) and return its mean
+# win rate against the rule-based opponents
+def run_trial(trial_id, config, episodes, checkpoint_path, eval_episodes, aug, seed):
+    torch.set_num_threads(1)
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+    env = make_env(aug=aug, seed=seed)
+    trainer = DQNTrainer(env, **config)
+
+    if os.path.exists(checkpoint_path):
+        checkpoint = torch.load(checkpoint_path, map_location="cpu")
+        trainer.q_net.load_state_dict(checkpoint["q_net"])
+        trainer.optimizer.load_state_dict(checkpoint["optimizer"])
+        trainer.eps = checkpoint["eps"]
+        trainer.buffer.load_state_dict(checkpoint["buffer"])
+
+    trainer.train(episodes=episodes, log_every=0)
+    torch.save(
+        {
+            "q_net": trainer.q_net.state_dict(),
+            "optimizer": trainer.optimizer.state_dict(),
+            "eps": trainer.eps,
+            "buffer": trainer.buffer.state_dict(),
+            "config": config,
+        },
+        checkpoint_path,
+    )
+
+    trainer.q_net.eval()
+    win_rates = {}
+    for name, opponent_cls in SCENARIOS:
+        results = evaluate(trainer.q_net, opponent_cls(), eval_episodes, "cpu", aug=aug)
+        win_rates[name] = results["win"] / eval_episodes
+
+    return trial_id, float(np.mean(list(win_rates.values()))), win_rates
+
+
+# Successive halving: every rung trains the survivors up to the rung budget,
+# then keeps the best 1/eta of them for a budget eta times larger
+def successive_halving(args):
+    rng = random.Random(args.seed)
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    trials = {
+        trial_id: {"config": config, "trained": 0, "history": []}
+        for trial_id, config in enumerate(sample_configs(args.num_configs, rng))
+    }
+    alive = list(trials)
+    budget = args.min_episodes
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for rung in range(args.num_rungs):
+            futures = []
+            for trial_id in alive:
+                trial = trials[trial_id]
+                futures.append(pool.submit(
+                    run_trial,
+                    trial_id,
+                    trial["config"],
+                    budget - trial["trained"],
+                    os.path.join(args.out_dir, f"trial_{trial_id}.pth"),
+                    args.eval_episodes,
+                    args.aug,
+                    args.seed * 1000 + trial_id * 10 + rung,
+                ))
+
+            for future in futures:
+                trial_id, score, win_rates = future.result()
+                trial = trials[trial_id]
+                trial["trained"] = budget
+                trial["score"] = score
+                trial["history"].append({"episodes": budget, "score": score, "win_rates": win_rates})
+                print(f"rung {rung} | trial {trial_id} | episodes {budget} | win rate {score * 100:.1f}%")
+
+            alive.sort(key=lambda i: trials[i]["score"], reverse=True)
+            if rung < args.num_rungs - 1:
+                alive = alive[:max(1, math.ceil(len(alive) / args.eta))]
+                budget *= args.eta
+
+            with open(os.path.join(args.out_dir, "results.json"), "w") as f:
+                json.dump({"rung": rung, "alive": alive, "trials": trials}, f, indent=2)
+
+    best = alive[0]
+    print(f"best trial {best}: win rate {trials[best]['score'] * 100:.1f}%")
+    print(f"  config: {trials[best]['config']}")
+    print(f"  checkpoint: {os.path.join(args.out_dir, f'trial_{best}.pth')}")
+    return trials[best]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-configs", type=int, default=27)
+    parser.add_argument("--min-episodes", type=int, default=5000)
+    parser.add_argument("--num-rungs", type=int, default=4)
+    parser.add_argument("--eta", type=int, default=3)
+    parser.add_argument("--eval-episodes", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--aug", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out-dir", default="sweep")
+    args = parser.parse_args()
+
+    successive_halving(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
+import os
 import random
 import numpy as np
 from model import DQN, ReplayBuffer
+from experience import ShardWriter, ShardReader
 
 import torch
 import torch.nn as nn
@@ -67,11 +69,17 @@ class DQNTrainer:
         batch = self.buffer.sample(self.batch_size)
         states, actions, rewards, next_states, dones = zip(*batch)
 
-        states = torch.tensor(states, dtype=torch.float32).to(self.device)
-        actions = torch.tensor(actions, dtype=torch.int64).unsqueeze(1).to(self.device)
-        rewards = torch.tensor(rewards, dtype=torch.float32).unsqueeze(1).to(self.device)
-        next_states = torch.tensor(next_states, dtype=torch.float32).to(self.device)
-        dones = torch.tensor(dones, dtype=torch.float32).unsqueeze(1).to(self.device)
+        return self.learn(
+            np.array(states), np.array(actions), np.array(rewards), np.array(next_states), np.array(dones)
+        )
+
+    # One gradient step on a batch of transitions given as arrays
+    def learn(self, states, actions, rewards, next_states, dones):
+        states = torch.as_tensor(states, dtype=torch.float32).to(self.device)
+        actions = torch.as_tensor(actions, dtype=torch.int64).unsqueeze(1).to(self.device)
+        rewards = torch.as_tensor(rewards, dtype=torch.float32).unsqueeze(1).to(self.device)
+        next_states = torch.as_tensor(next_states, dtype=torch.float32).to(self.device)
+        dones = torch.as_tensor(dones, dtype=torch.float32).unsqueeze(1).to(self.device)
 
         q_values = self.q_net(states).gather(1, actions)
 
@@ -87,7 +95,7 @@ class DQNTrainer:
 
         return loss.item()
 
-    def train(self, episodes=100000):
+    def train(self, episodes=100000, log_every=100, writer=None):
 
         rewards_history = []
 
@@ -107,6 +115,8 @@ class DQNTrainer:
                 done = terminated or truncated
 
                 self.buffer.add(state, action, reward, next_state, done)
+                if writer is not None:
+                    writer.add(state, action, reward, next_state, done)
                 self.train_step()
 
                 state = next_state
@@ -115,12 +125,29 @@ class DQNTrainer:
             self.eps = max(self.eps * self.eps_decay, self.eps_end)
             rewards_history.append(ep_reward)
 
-            if ep % 100 == 0:
-                avg = np.mean(rewards_history[-100:])
-                print(f"Episode {ep} | avg reward (last 100): {avg:.2f} | eps: {self.eps:.3f}")
+            if log_every and ep % log_every == 0:
+                avg = np.mean(rewards_history[-log_every:])
+                print(f"Episode {ep} | avg reward (last {log_every}): {avg:.2f} | eps: {self.eps:.3f}")
+
+        if writer is not None:
+            writer.close()
 
         return rewards_history
 
+    # Train from transitions already stored on disk (see experience.py)
+    def train_offline(self, reader, steps=1_000_000, log_every=10_000):
+
+        losses = []
+
+        for step in range(steps):
+            losses.append(self.learn(*reader.sample(self.batch_size)))
+
+            if log_every and step % log_every == 0:
+                avg = np.mean(losses[-log_every:])
+                print(f"Step {step} | avg loss (last {log_every}): {avg:.4f}")
+
+        return losses
+
 def get_opponent(name: str):
     name = name.lower().strip()
     if name in {"1"}:
@@ -131,17 +158,20 @@ def get_opponent(name: str):
         return RuleBasedOpponentV3()
     return RandomOpponent()
 
-def make_env(opponent_name: str = None, aug: bool = False):
+def make_env(opponent_name: str = None, aug: bool = False, seed=None):
     if opponent_name:
         opponent = get_opponent(opponent_name)
-        return BriscolaEnv(opponent=opponent, aug=aug)
-    return BriscolaEnv(aug=aug)
+        return BriscolaEnv(opponent=opponent, aug=aug, seed=seed)
+    return BriscolaEnv(aug=aug, seed=seed)
 
 
 def main():
 
     parser = argparse.ArgumentParser()
     parser.add_argument("--aug", default="False")
+    parser.add_argument("--record-dir", default=None)
+    parser.add_argument("--offline-dir", default=None)
+    parser.add_argument("--offline-steps", type=int, default=1_000_000)
     args = parser.parse_args()
 
     aug = args.aug
@@ -152,7 +182,16 @@ def main():
 
     trainer = DQNTrainer(env, num_nodes=128 if aug else None)
 
-    trainer.train(episodes=500000)
+    if args.offline_dir:
+        reader = ShardReader(args.offline_dir)
+        assert reader.state_dim == env.observation_space.shape[0], "Shards were recorded with another encoding"
+        print(f"Offline transitions: {len(reader)}")
+        trainer.train_offline(reader, steps=args.offline_steps)
+    else:
+        writer = None
+        if args.record_dir:
+            writer = ShardWriter(args.record_dir, env.observation_space.shape[0], prefix=f"actor{os.getpid()}")
+        trainer.train(episodes=500000, writer=writer)
 
     torch.save(trainer.q_net.state_dict(), "aug_hard.pth")
 
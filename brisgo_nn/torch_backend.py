@@ -0,0 +1,58 @@
+import numpy as np
+import torch
+from torch import nn
+
+
+class DQN(nn.Module):
+    def __init__(self, state_dim: int, num_actions: int, num_nodes: int = 64):
+        super().__init__()
+        self.net = nn.Sequential(
+            nn.Linear(state_dim, num_nodes),
+            nn.ReLU(),
+            nn.Linear(num_nodes, num_nodes),
+            nn.ReLU(),
+            nn.Linear(num_nodes, num_actions)
+        )
+
+    def forward(self, x):
+        return self.net(x)
+
+
+# int8 weights, activations quantized on the fly (CPU only). Per-channel
+# scales, since a few large weights per layer make per-tensor scales too coarse
+def quantize_int8(model: nn.Module) -> nn.Module:
+    qconfig = torch.ao.quantization.per_channel_dynamic_qconfig
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear: qconfig}, dtype=torch.qint8)
+
+
+# Served model: float32 states (N, state_dim) in, float32 Q-values (N, actions)
+# out, whatever precision the weights are in
+class TorchModel:
+
+    def __init__(self, model: nn.Module, dtype=torch.float32):
+        self.model = model
+        self.dtype = dtype
+
+    def __call__(self, states: np.ndarray) -> np.ndarray:
+        with torch.no_grad():
+            return self.model(torch.from_numpy(states).to(self.dtype)).float().numpy()
+
+
+WEIGHTS_SUFFIX = ".pth"
+PRECISIONS = ("fp32", "fp16", "int8")
+
+# With shared=True, float32 weights stay memory-mapped from the .pth file
+# (torch.load(mmap=True) + assign), so the processes serving the same file
+# share its page cache copy. fp16 and int8 convert the weights, hence copy them
+def load_model(path, state_dim, num_actions, precision="fp32", num_nodes=64, shared=False):
+    model = DQN(state_dim=state_dim, num_actions=num_actions, num_nodes=num_nodes)
+    if precision == "int8":
+        model = quantize_int8(model)
+    mmap = shared and precision == "fp32"
+    state_dict = torch.load(path, map_location="cpu", mmap=mmap)
+    model.load_state_dict(state_dict, assign=mmap)
+    model.eval()
+    if precision == "fp16":
+        model.half()
+        return TorchModel(model, torch.float16)
+    return TorchModel(model)